@@ -0,0 +1,105 @@
+"""
+Leaderboard with a million synthetic users: in-memory rank index vs SQL
+
+    python -m benchmarks.leaderboard_benchmark --users 1000000 --maps 20
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from modules.leaderboard import Leaderboard
+
+
+def timed(fn, count: int) -> float:
+    """Average microseconds per call of fn(i) over count calls"""
+    started = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def synthetic_users(count: int, maps: int, rng: random.Random):
+    # Long-tailed scores, like real players
+    return [(user_id, int(rng.paretovariate(1.2) * 100), f'map_{rng.randrange(maps)}')
+            for user_id in range(1, count + 1)]
+
+
+def bench_memory(users, maps: int, queries: int, rng: random.Random):
+    board = Leaderboard()
+    started = time.perf_counter()
+    board.load(users)
+    build_s = time.perf_counter() - started
+
+    ids = [rng.randrange(1, len(users) + 1) for _ in range(queries)]
+    updates = [(user_id, rng.randrange(100000), f'map_{rng.randrange(maps)}') for user_id in ids]
+    offsets = [rng.randrange(len(users) - 20) for _ in range(queries)]
+    return {
+        'build_s': build_s,
+        'update_us': timed(lambda i: board.update(*updates[i]), queries),
+        'rank_us': timed(lambda i: board.rank(ids[i]), queries),
+        'map_rank_us': timed(lambda i: board.rank(ids[i], updates[i][2]), queries),
+        'top_page_us': timed(lambda i: board.page(0, 20), queries),
+        'deep_page_us': timed(lambda i: board.page(offsets[i], 20), queries)
+    }
+
+
+def bench_sql(users, queries: int, rng: random.Random):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'leaderboard.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE user (id INTEGER PRIMARY KEY, score INTEGER NOT NULL, '
+                     'selected_map TEXT NOT NULL)')
+        conn.executemany('INSERT INTO user VALUES (?, ?, ?)', users)
+        conn.execute('CREATE INDEX ix_user_score_rank ON user (score DESC, id)')
+        conn.execute('CREATE INDEX ix_user_map_score_rank ON user (selected_map, score DESC, id)')
+        conn.commit()
+
+        ids = [rng.randrange(1, len(users) + 1) for _ in range(queries)]
+        offsets = [rng.randrange(len(users) - 20) for _ in range(queries)]
+
+        def rank(i):
+            score, = conn.execute('SELECT score FROM user WHERE id = ?', (ids[i],)).fetchone()
+            conn.execute('SELECT COUNT(*) FROM user WHERE score > ? OR (score = ? AND id < ?)',
+                         (score, score, ids[i])).fetchone()
+
+        def page(offset):
+            conn.execute('SELECT id, score FROM user ORDER BY score DESC, id LIMIT 20 OFFSET ?',
+                         (offset,)).fetchall()
+
+        result = {
+            'rank_us': timed(rank, queries),
+            'top_page_us': timed(lambda i: page(0), queries),
+            'deep_page_us': timed(lambda i: page(offsets[i]), queries)
+        }
+        conn.close()
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--maps', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--sql-queries', type=int, default=20, help='SQL rank/deep-page queries are O(n)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    users = synthetic_users(args.users, args.maps, rng)
+
+    memory = bench_memory(users, args.maps, args.queries, rng)
+    print(f'{args.users} users, in-memory leaderboard built in {memory["build_s"]:.2f}s')
+    for key in ('update_us', 'rank_us', 'map_rank_us', 'top_page_us', 'deep_page_us'):
+        print(f'  memory {key[:-3]:<10} {memory[key]:>12.1f} us')
+
+    sql = bench_sql(users, args.sql_queries, rng)
+    print('SQLite with indexes')
+    for key in ('rank_us', 'top_page_us', 'deep_page_us'):
+        print(f'  sql    {key[:-3]:<10} {sql[key]:>12.1f} us')
+
+
+if __name__ == '__main__':
+    main()
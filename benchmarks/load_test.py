@@ -0,0 +1,570 @@
+"""
+Load test of the Flask endpoints against a scratch database
+
+    python -m benchmarks.load_test --users 200 --maps 50 --concurrency 8 --iterations 20
+    python -m benchmarks.load_test --server --workers 4 --json results.json --baseline last.json
+
+Seeds a temporary SQLite database with synthetic users and generated maps,
+then runs each scenario with `--concurrency` virtual players, either through
+the Flask test client (default) or over HTTP against a local multi-process
+server (--server). Reports throughput and p50/p95/p99 latency per endpoint
+and MapGenerator.generate_map timing per (size, complexity).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from modules.map_generator import MapGenerator
+
+
+PASSWORD = 'load-test-password'
+SCENARIOS = ['login_storm', 'state_polling', 'xp_posts', 'map_saves', 'saved_map_listing', 'all_routes']
+PERCENTILES = (0.50, 0.95, 0.99)
+
+# State updates the API must answer with 400 without writing anything
+REJECTED_STATE_UPDATES = [
+    ('/api/player', {'changes': {'score': 1.5}}),
+    ('/api/player', {'changes': {'score': 'abc'}}),
+    ('/api/player', {'changes': {'score': 5_000_000_000}}),
+    ('/api/player', {'changes': {'gold': -1}}),
+    ('/api/player', {'changes': {'current_wave': True}}),
+    ('/api/player', {'version': 'abc', 'changes': {'gold': 1}}),
+    ('/api/player', ['not', 'an', 'object']),
+    ('/api/gamestate', {'changes': {'selected_map': 'no_such_map'}}),
+    ('/api/gamestate', {'changes': {'selected_map': ['holy_c_path']}}),
+    ('/api/progression', {'xp_gained': -5}),
+    ('/api/progression', {'xp_gained': 2 ** 31}),
+    ('/api/progression', {'xp_gained': '100'}),
+    ('/api/progression', {'xp': 100})
+]
+
+# /api/simulate bodies (besides map_id) that must be rejected with 400
+REJECTED_SIMULATIONS = [
+    {'waves': [5000]},
+    {'waves': [True]},
+    {'waves': [1000], 'runs': 100},
+    {'runs': '5'},
+    {'towers': [{'type': 'basic', 'x': 99999, 'y': 0}]},
+    {'towers': [{'type': 'no_such_tower', 'x': 1, 'y': 1}]},
+    {'towers': ['basic']},
+    {'auto_towers': {'count': 10 ** 9}},
+    {'seed': 'abc'}
+]
+
+# Overrides applied to the sample map that /api/save-custom-map must reject with 400
+REJECTED_MAP_GEOMETRY = [
+    {'dimensions': {'width': 4000, 'height': 4000}},
+    {'dimensions': {'width': 20.5, 'height': 20}},
+    {'dimensions': None},
+    {'start': {'x': -1, 'y': 0}},
+    {'path': [{'x': 40000, 'y': 0}]},
+    {'path': [{'x': '1', 'y': 0}]},
+    {'obstacles': [{'type': 'rock'}]}
+]
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+# --- Seeding ---
+
+def prepare_environment(tmp: str):
+    """Point the app at scratch databases; must run before main_stefan is imported"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'users.db')
+    os.environ['MAP_DB_PATH'] = os.path.join(tmp, 'maps.db')
+
+
+def seed(app_module, users: int, maps: int, seed_value: int):
+    """
+    Insert users (all sharing one password hash, so seeding does not pay for
+    thousands of scrypt runs) and generated maps. Returns (usernames, map ids).
+    """
+    app, db = app_module.app, app_module.db
+    rng = random.Random(seed_value)
+    with app.app_context():
+        app_module.init_db()
+        password_hash = app_module.password_hasher.hash(PASSWORD)
+        usernames = [f'load_user_{i}' for i in range(1, users + 1)]
+        db.session.execute(app_module.User.__table__.insert(), [
+            {'username': name, 'password_hash': password_hash, 'level': 1, 'xp': 0,
+             'selected_map': 'holy_c_path', 'gold': 500, 'lives': 20, 'wave': rng.randint(1, 30),
+             'score': int(rng.paretovariate(1.2) * 100), 'state_version': 0}
+            for name in usernames
+        ])
+        db.session.execute(app_module.TowerUnlock.__table__.insert().from_select(
+            ['user_id', 'tower_id', 'position'],
+            app_module.select(app_module.User.id, app_module.text(f"'{app_module.DEFAULT_TOWER}'"),
+                              app_module.text('0'))
+        ))
+        db.session.commit()
+
+    generator = MapGenerator(cache_size=0)
+    options = (generator.get_sizes(), generator.get_complexities(), generator.get_difficulties())
+    map_ids = []
+    for i in range(maps):
+        size, complexity, difficulty = (rng.choice(list(values)) for values in options)
+        map_data = generator.generate_map(difficulty=difficulty, size=size, complexity=complexity,
+                                          seed=seed_value * 100003 + i)
+        map_data['id'] = f'load_map_{i}'
+        map_ids.append(app_module.map_store.add(map_data))
+    return usernames, map_ids
+
+
+# --- Clients ---
+
+class TestClientSession:
+    """One virtual player driving the app in-process through Flask's test client"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method: str, path: str, json_body=None, form=None, headers=None):
+        response = self._client.open(path, method=method, json=json_body, data=form, headers=headers)
+        body = response.get_data()
+        return response.status_code, response.headers, body
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One virtual player talking HTTP to a local server, with its own cookie jar"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method: str, path: str, json_body=None, form=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self._opener.open(req, timeout=60) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+SERVER_CODE = (
+    'import sys, main_stefan\n'
+    "main_stefan.app.run(host='127.0.0.1', port=int(sys.argv[1]), processes=int(sys.argv[2]),\n"
+    '                    threaded=False, use_reloader=False)\n'
+)
+
+
+def start_server(workers: int):
+    """Start the app with `workers` forked processes; returns (process, base URL)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-c', SERVER_CODE, str(port), str(workers)],
+                               env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('load test server exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('load test server did not start within 30s')
+
+
+# --- Recording ---
+
+class Recorder:
+    """Latencies and error counts per endpoint label, shared by all workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def call(self, session, label: str, method: str, path: str, ok=(200, 302, 304), **kwargs):
+        started = time.perf_counter()
+        try:
+            status, headers, body = session.request(method, path, **kwargs)
+        except Exception:
+            status, headers, body = None, {}, b''
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.latencies.setdefault(label, []).append(elapsed)
+            if status not in ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return status, headers, body
+
+    def summary(self, wall_s: float) -> dict:
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            row = {
+                'count': len(values),
+                'errors': self.errors.get(label, 0),
+                'rps': round(len(values) / wall_s, 1) if wall_s else 0.0,
+                'mean_ms': round(sum(values) / len(values), 3)
+            }
+            for p in PERCENTILES:
+                row[f'p{int(p * 100)}_ms'] = round(percentile(values, p), 3)
+            row['max_ms'] = round(values[-1], 3)
+            endpoints[label] = row
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            'wall_s': round(wall_s, 3),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'rps': round(total / wall_s, 1) if wall_s else 0.0,
+            'endpoints': endpoints
+        }
+
+
+# --- Scenarios ---
+
+def login(recorder, session, username: str):
+    status, _, _ = recorder.call(session, 'POST /login', 'POST', '/login',
+                                 form={'username': username, 'password': PASSWORD}, ok=(302,))
+    return status == 302
+
+
+def login_storm(ctx, recorder, rng):
+    """A fresh session logs in and out, so every iteration pays for one password check"""
+    session = ctx.new_session()
+    if login(recorder, session, rng.choice(ctx.usernames)):
+        recorder.call(session, 'GET /logout', 'GET', '/logout', ok=(302,))
+
+
+def state_polling(ctx, recorder, rng):
+    """The game client polling its state, revalidating with If-None-Match"""
+    session = ctx.player(rng)
+    etag = ctx.etags.get(id(session))
+    headers = {'If-None-Match': etag} if etag else None
+    status, response_headers, _ = recorder.call(session, 'GET /api/gamestate', 'GET', '/api/gamestate',
+                                                headers=headers)
+    if status == 200 and response_headers.get('ETag'):
+        ctx.etags[id(session)] = response_headers.get('ETag')
+    recorder.call(session, 'GET /api/player', 'GET', '/api/player')
+    recorder.call(session, 'GET /api/progression', 'GET', '/api/progression')
+
+
+def xp_posts(ctx, recorder, rng):
+    """End of a wave: award XP and push a state delta"""
+    session = ctx.player(rng)
+    recorder.call(session, 'POST /api/progression', 'POST', '/api/progression',
+                  json_body={'xp_gained': rng.randint(10, 200)})
+    recorder.call(session, 'POST /api/player', 'POST', '/api/player',
+                  json_body={'changes': {'score': rng.randint(0, 100000), 'wave': rng.randint(1, 50)}})
+
+
+def map_saves(ctx, recorder, rng):
+    session = ctx.player(rng)
+    status, _, body = recorder.call(session, 'POST /api/generate-map', 'POST', '/api/generate-map',
+                                    json_body={'size': rng.choice(['small', 'medium']),
+                                               'seed': rng.randrange(2 ** 31)})
+    if status != 200:
+        return
+    map_data = json.loads(body)['map']
+    map_data['id'] = f'load_saved_{rng.randrange(2 ** 63)}'
+    recorder.call(session, 'POST /api/save-custom-map', 'POST', '/api/save-custom-map',
+                  json_body={'map': map_data})
+
+
+def saved_map_listing(ctx, recorder, rng):
+    """The map loader: page through summaries, then open one map"""
+    session = ctx.player(rng)
+    cursor = None
+    for _ in range(3):
+        path = '/api/get-saved-maps?limit=50' + (f'&cursor={urllib.parse.quote(cursor)}' if cursor else '')
+        status, _, body = recorder.call(session, 'GET /api/get-saved-maps', 'GET', path)
+        if status != 200:
+            return
+        cursor = json.loads(body).get('next_cursor')
+        if not cursor:
+            break
+    recorder.call(session, 'GET /api/load-map/<map_id>', 'GET', f'/api/load-map/{rng.choice(ctx.map_ids)}')
+
+
+def route_requests(ctx, rng):
+    """(rule, method, path, kwargs) for one request to every route"""
+    map_id = rng.choice(ctx.map_ids)
+    return [
+        ('/login', 'GET', '/login', {}),
+        ('/register', 'GET', '/register', {}),
+        ('/', 'GET', '/', {}),
+        ('/game', 'GET', '/game', {}),
+        ('/options', 'POST', '/options', {}),
+        ('/credits', 'POST', '/credits', {}),
+        ('/static/<path:filename>', 'GET', '/static/script.js', {}),
+        ('/api/maps', 'GET', '/api/maps', {}),
+        ('/api/maps', 'GET', '/api/maps?format=compact', {}),
+        ('/api/player', 'GET', '/api/player', {}),
+        ('/api/gamestate', 'GET', '/api/gamestate', {}),
+        ('/api/player', 'POST', '/api/player', {'json_body': {'changes': {'score': rng.randint(0, 100000)}}}),
+        ('/api/gamestate', 'POST', '/api/gamestate', {'json_body': {'changes': {'selected_map': map_id}}}),
+        *[(rule, 'POST', rule, {'json_body': body, 'ok': (400,)}) for rule, body in REJECTED_STATE_UPDATES],
+        ('/api/leaderboard', 'GET', '/api/leaderboard?around=me', {}),
+        ('/api/user-cache', 'GET', '/api/user-cache', {}),
+        ('/api/password-pool', 'GET', '/api/password-pool', {}),
+        ('/api/write-buffer', 'GET', '/api/write-buffer', {}),
+        ('/api/progression', 'GET', '/api/progression', {}),
+        ('/api/progression', 'POST', '/api/progression', {'json_body': {'xp_gained': rng.randint(10, 200)}}),
+        ('/api/towers', 'GET', '/api/towers', {}),
+        ('/api/enemies', 'GET', '/api/enemies', {}),
+        ('/api/bootstrap', 'GET', '/api/bootstrap', {}),
+        ('/api/bootstrap', 'GET', '/api/bootstrap?include=path_table', {}),
+        ('/api/waves/<spec>', 'GET', f'/api/waves/{rng.randint(1, 50)}-{rng.randint(51, 100)}', {}),
+        ('/api/simulate', 'POST', '/api/simulate',
+         {'json_body': {'map_id': map_id, 'auto_towers': {'count': 3}, 'waves': [1], 'runs': 5}}),
+        *[('/api/simulate', 'POST', '/api/simulate', {'json_body': dict(body, map_id=map_id), 'ok': (400,)})
+          for body in REJECTED_SIMULATIONS],
+        ('/generator', 'GET', '/generator', {}),
+        ('/api/generate-map', 'POST', '/api/generate-map', {'json_body': {'size': 'small'}}),
+        ('/api/generate-maps-batch', 'POST', '/api/generate-maps-batch',
+         {'json_body': {'grid': {'size': ['small']}, 'count': 2}}),
+        ('/api/save-custom-map', 'POST', '/api/save-custom-map',
+         {'json_body': {'map': dict(ctx.sample_map, id=f'load_route_{rng.randrange(2 ** 63)}')}}),
+        *[('/api/save-custom-map', 'POST', '/api/save-custom-map',
+           {'json_body': {'map': dict(ctx.sample_map, id=f'load_route_{rng.randrange(2 ** 63)}', **override)},
+            'ok': (400,)}) for override in REJECTED_MAP_GEOMETRY],
+        ('/api/themes', 'GET', '/api/themes', {}),
+        ('/api/generator-options', 'GET', '/api/generator-options', {}),
+        ('/api/get-saved-maps', 'GET', '/api/get-saved-maps', {}),
+        ('/api/load-map/<map_id>', 'GET', f'/api/load-map/{map_id}', {}),
+        ('/api/maps/<map_id>/heatmap', 'GET', f'/api/maps/{map_id}/heatmap', {}),
+        ('/metrics', 'GET', '/metrics', {}),
+        # Load test players are not admins
+        ('/api/admin/profiles', 'GET', '/api/admin/profiles', {'ok': (403,)}),
+        ('/api/admin/profiles/<name>', 'GET', '/api/admin/profiles/unknown', {'ok': (403,)}),
+        ('/logout', 'GET', '/logout', {})
+    ]
+
+
+def all_routes(ctx, recorder, rng):
+    """Every route once, as a logged-in player (ending with a logout)"""
+    session = ctx.new_session()
+    if not login(recorder, session, rng.choice(ctx.usernames)):
+        return
+    for rule, method, path, kwargs in route_requests(ctx, rng):
+        recorder.call(session, f'{method} {rule}', method, path, **kwargs)
+
+
+class Context:
+    """Seeded data plus a pool of logged-in sessions shared by the scenarios"""
+
+    def __init__(self, new_session, usernames, map_ids, sample_map, players: int):
+        self.new_session = new_session
+        self.usernames = usernames
+        self.map_ids = map_ids
+        self.sample_map = sample_map
+        self.etags = {}
+        self._players = []
+        recorder = Recorder()
+        for username in usernames[:players]:
+            session = new_session()
+            if login(recorder, session, username):
+                self._players.append(session)
+        if not self._players:
+            raise RuntimeError('no virtual player could log in')
+
+    def player(self, rng):
+        return rng.choice(self._players)
+
+
+def run_scenario(ctx, scenario, concurrency: int, iterations: int, seed_value: int) -> dict:
+    recorder = Recorder()
+
+    def worker(index: int):
+        rng = random.Random(seed_value * 7919 + index)
+        for _ in range(iterations):
+            scenario(ctx, recorder, rng)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - started)
+
+
+def uncovered_routes(app) -> list:
+    """Routes of the app that all_routes does not exercise"""
+    covered = {rule for rule, _, _, _ in route_requests(_RuleProbe(), random.Random(0))}
+    return sorted(rule.rule for rule in app.url_map.iter_rules() if rule.rule not in covered)
+
+
+class _RuleProbe:
+    map_ids = ['0']
+    sample_map = {}
+
+
+# --- Map generation timing ---
+
+def time_generator(runs: int, seed_value: int) -> list:
+    generator = MapGenerator(cache_size=0)
+    rows = []
+    for size in generator.get_sizes():
+        for complexity in generator.get_complexities():
+            samples = []
+            for i in range(runs):
+                started = time.perf_counter()
+                generator.generate_map(size=size, complexity=complexity, seed=seed_value + i)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            rows.append({
+                'size': size,
+                'complexity': complexity,
+                'runs': runs,
+                'mean_ms': round(sum(samples) / runs, 3),
+                'p50_ms': round(percentile(samples, 0.50), 3),
+                'p95_ms': round(percentile(samples, 0.95), 3),
+                'max_ms': round(samples[-1], 3)
+            })
+    return rows
+
+
+# --- Reporting ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Endpoints whose p95 grew by more than tolerance (a fraction) since the baseline"""
+    regressions = []
+    for name, scenario in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {}).get('endpoints', {})
+        for label, row in scenario['endpoints'].items():
+            old = before.get(label)
+            if old and old['p95_ms'] > 0 and row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                regressions.append({'scenario': name, 'endpoint': label,
+                                    'baseline_p95_ms': old['p95_ms'], 'p95_ms': row['p95_ms']})
+    for row in results['generator']:
+        old = next((b for b in baseline.get('generator', [])
+                    if (b['size'], b['complexity']) == (row['size'], row['complexity'])), None)
+        if old and old['p95_ms'] > 0 and row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append({'scenario': 'generator', 'endpoint': f"{row['size']}/{row['complexity']}",
+                                'baseline_p95_ms': old['p95_ms'], 'p95_ms': row['p95_ms']})
+    return regressions
+
+
+def print_report(results: dict):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n{name}: {scenario['requests']} requests in {scenario['wall_s']:.2f}s "
+              f"({scenario['rps']:.0f} req/s, {scenario['errors']} errors)")
+        print(f"  {'endpoint':<38} {'count':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for label, row in scenario['endpoints'].items():
+            print(f"  {label:<38} {row['count']:>6} {row['errors']:>4} {row['rps']:>8.1f} "
+                  f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+    if results['generator']:
+        print('\ngenerate_map')
+        print(f"  {'size':<8} {'complexity':<10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for row in results['generator']:
+            print(f"  {row['size']:<8} {row['complexity']:<10} {row['mean_ms']:>9.2f} "
+                  f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}")
+    if results['uncovered_routes']:
+        print(f"\nwarning: routes not covered by all_routes: {', '.join(results['uncovered_routes'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--maps', type=int, default=50)
+    parser.add_argument('--players', type=int, default=32, help='logged-in sessions shared by the scenarios')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20, help='scenario iterations per worker')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--server', action='store_true', help='drive a local multi-process server over HTTP')
+    parser.add_argument('--workers', type=int, default=4, help='server processes with --server')
+    parser.add_argument('--generator-runs', type=int, default=5, help='generate_map calls per (size, complexity), 0 to skip')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write machine-readable results to this file')
+    parser.add_argument('--baseline', help='earlier --json output to compare p95 latencies against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth over the baseline')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_environment(tmp)
+        import main_stefan
+
+        usernames, map_ids = seed(main_stefan, args.users, args.maps, args.seed)
+        sample_map = main_stefan.map_store.get(map_ids[0])
+        server = None
+        try:
+            if args.server:
+                server, base_url = start_server(args.workers)
+                new_session = lambda: HttpSession(base_url)
+            else:
+                new_session = lambda: TestClientSession(main_stefan.app)
+            ctx = Context(new_session, usernames, map_ids, sample_map, min(args.players, len(usernames)))
+
+            scenarios = {}
+            for name in args.scenarios:
+                scenarios[name] = run_scenario(ctx, globals()[name], args.concurrency,
+                                               args.iterations, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            main_stefan.user_write_buffer.stop()
+
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'python': sys.version.split()[0],
+                'mode': f'server x{args.workers}' if args.server else 'test client',
+                'args': vars(args)
+            },
+            'scenarios': scenarios,
+            'generator': time_generator(args.generator_runs, args.seed) if args.generator_runs else [],
+            'uncovered_routes': uncovered_routes(main_stefan.app)
+        }
+
+    print_report(results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('mode') != results['meta']['mode']:
+            print(f"warning: baseline was run in {baseline.get('meta', {}).get('mode')!r} mode, "
+                  f"not {results['meta']['mode']!r}")
+        results['regressions'] = compare(results, baseline, args.tolerance)
+        for row in results['regressions']:
+            print(f"regression: {row['scenario']} {row['endpoint']} p95 "
+                  f"{row['baseline_p95_ms']:.2f} -> {row['p95_ms']:.2f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if results.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
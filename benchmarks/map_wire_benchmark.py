@@ -0,0 +1,84 @@
+"""
+Size and latency of the map wire formats
+
+    python -m benchmarks.map_wire_benchmark --generated 1000 5000
+"""
+import argparse
+import json
+import random
+import time
+
+from modules import map_wire
+from modules.map_generator import MapGenerator
+from modules.map_grid import MapGrid
+
+
+def time_call(fn, repeat: int):
+    """Best-of-repeat wall time of fn() in milliseconds, and its last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def decode(body: bytes, fmt: str, encoding):
+    """Client side: undo the content encoding and parse into the JSON map shape"""
+    raw = map_wire.decompress(body, encoding)
+    if fmt == 'binary':
+        return map_wire.unpack_maps(raw)
+    if fmt == 'compact':
+        return [map_wire.expand_compact(m) for m in json.loads(raw)]
+    return json.loads(raw)
+
+
+def generated_maps(count: int, seed: int):
+    generator = MapGenerator(cache_size=0)
+    rng = random.Random(seed)
+    maps = []
+    for i in range(count):
+        maps.append(generator.generate_map(
+            difficulty=rng.choice(generator.get_difficulties()),
+            theme=rng.choice(list(generator.get_themes())),
+            size=rng.choice(['small', 'medium', 'large']),
+            complexity=rng.choice(generator.get_complexities()),
+            seed=seed + i
+        ))
+    return maps
+
+
+def run_case(label: str, maps, repeat: int):
+    grids = [MapGrid.from_json(m) for m in maps]
+    pretty = len(json.dumps(maps, indent=4).encode('utf-8'))
+    print(f'\n{label}: {len(maps)} maps, indent=4 JSON is {pretty} bytes')
+    print(f"{'format':>8} {'encoding':>9} {'bytes':>10} {'ratio':>7} {'encode ms':>10} {'decode ms':>10}")
+    for fmt in map_wire.MEDIA_TYPES:
+        for encoding in (None,) + map_wire.ENCODINGS:
+            def encode():
+                return map_wire.compress(map_wire.serialize(grids, fmt), encoding)
+            encode_ms, body = time_call(encode, repeat)
+            decode_ms, decoded = time_call(lambda: decode(body, fmt, encoding), repeat)
+            if len(decoded) != len(maps):
+                raise AssertionError(f'{fmt}/{encoding} lost maps')
+            print(f"{fmt:>8} {encoding or 'identity':>9} {len(body):>10} {pretty / len(body):>6.1f}x "
+                  f"{encode_ms:>10.2f} {decode_ms:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--maps-file', default='map_data/maps.json')
+    parser.add_argument('--generated', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open(args.maps_file, 'r') as f:
+        run_case(args.maps_file, json.load(f), args.repeat)
+    for count in args.generated:
+        run_case('generated', generated_maps(count, args.seed), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
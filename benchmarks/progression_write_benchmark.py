@@ -0,0 +1,147 @@
+"""
+Concurrent progression writes: JSON unlock column on default SQLite
+settings vs the tower_unlock table on the tuned engine
+
+    python -m benchmarks.progression_write_benchmark --threads 1 4 8 --ops 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from modules import sqlite_tuning
+
+
+TOWERS = ['basic', 'fast', 'heavy', 'sniper', 'splash', 'holy_c', 'freeze', 'poison']
+UNLOCK_EVERY = 10  # one op in ten unlocks a tower, like a level up
+
+
+def make_engine(path: str, tuned: bool):
+    url = f'sqlite:///{path}'
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **sqlite_tuning.engine_options(url))
+    event.listen(engine, 'connect', sqlite_tuning.apply_pragmas)
+    return engine
+
+
+def setup_legacy(engine, users: int):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE user (id INTEGER PRIMARY KEY, level INTEGER NOT NULL, '
+                          'xp INTEGER NOT NULL, unlocked_towers VARCHAR(500) NOT NULL)'))
+        conn.execute(text('INSERT INTO user (id, level, xp, unlocked_towers) VALUES (:id, 1, 0, :towers)'),
+                     [{'id': i, 'towers': '["basic"]'} for i in range(1, users + 1)])
+
+
+def setup_normalized(engine, users: int):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE user (id INTEGER PRIMARY KEY, level INTEGER NOT NULL, '
+                          'xp INTEGER NOT NULL)'))
+        conn.execute(text('CREATE TABLE tower_unlock (user_id INTEGER NOT NULL REFERENCES user (id), '
+                          'tower_id VARCHAR(50) NOT NULL, position INTEGER NOT NULL, '
+                          'PRIMARY KEY (user_id, tower_id))'))
+        conn.execute(text('INSERT INTO user (id, level, xp) VALUES (:id, 1, 0)'),
+                     [{'id': i} for i in range(1, users + 1)])
+        conn.execute(text("INSERT INTO tower_unlock (user_id, tower_id, position) VALUES (:id, 'basic', 0)"),
+                     [{'id': i} for i in range(1, users + 1)])
+
+
+def write_legacy(conn, user_id: int, unlock: str):
+    """Read-modify-write of the JSON column, as _update_unlocked_towers used to"""
+    level, xp, raw = conn.execute(text('SELECT level, xp, unlocked_towers FROM user WHERE id = :id'),
+                                  {'id': user_id}).one()
+    towers = json.loads(raw)
+    if unlock and unlock not in towers:
+        towers.append(unlock)
+    conn.execute(text('UPDATE user SET level = :level, xp = :xp, unlocked_towers = :towers WHERE id = :id'),
+                 {'level': level + (1 if unlock else 0), 'xp': xp + 25,
+                  'towers': json.dumps(towers), 'id': user_id})
+
+
+def write_normalized(conn, user_id: int, unlock: str):
+    level, xp = conn.execute(text('SELECT level, xp FROM user WHERE id = :id'), {'id': user_id}).one()
+    conn.execute(text('UPDATE user SET level = :level, xp = :xp WHERE id = :id'),
+                 {'level': level + (1 if unlock else 0), 'xp': xp + 25, 'id': user_id})
+    if unlock:
+        conn.execute(text('INSERT OR IGNORE INTO tower_unlock (user_id, tower_id, position) '
+                          'SELECT :id, :tower, COUNT(*) FROM tower_unlock WHERE user_id = :id'),
+                     {'id': user_id, 'tower': unlock})
+
+
+def run_case(label: str, tuned: bool, setup, write, threads: int, ops: int, users: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'bench.db'), tuned)
+        setup(engine, users)
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def worker(index: int):
+            rng = random.Random(seed + index)
+            local = []
+            for i in range(ops // threads):
+                user_id = rng.randint(1, users)
+                unlock = rng.choice(TOWERS) if i % UNLOCK_EVERY == 0 else None
+                started = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        write(conn, user_id, unlock)
+                except OperationalError:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        'case': label,
+        'threads': threads,
+        'ops_per_s': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'errors': errors[0]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--ops', type=int, default=2000, help='writes per case (split over threads)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    cases = [
+        ('before', False, setup_legacy, write_legacy),
+        ('after', True, setup_normalized, write_normalized)
+    ]
+    print(f"{'case':>7} {'threads':>8} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for threads in args.threads:
+        for label, tuned, setup, write in cases:
+            row = run_case(label, tuned, setup, write, threads, args.ops, args.users, args.seed)
+            print(f"{row['case']:>7} {row['threads']:>8} {row['ops_per_s']:>9.0f} {row['p50_ms']:>8.3f} "
+                  f"{row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Spatial hash vs brute-force tower targeting
+
+    python -m benchmarks.targeting_benchmark --enemies 500 2000 5000 --towers 100 300
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.targeting import SpatialHash, closest_in_range_brute
+
+
+def time_call(fn, repeat: int) -> float:
+    """Best-of-repeat wall time of fn() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run_case(num_enemies: int, num_towers: int, width: float, height: float,
+             tower_range: float, repeat: int, rng: np.random.Generator) -> dict:
+    ex = rng.uniform(0, width, num_enemies)
+    ey = rng.uniform(0, height, num_enemies)
+    tx = rng.uniform(0, width, num_towers)
+    ty = rng.uniform(0, height, num_towers)
+    ranges = np.full(num_towers, tower_range)
+
+    index = SpatialHash(cell_size=tower_range)
+
+    def hashed():
+        index.rebuild(ex, ey)
+        return index.closest_in_range(tx, ty, ranges)
+
+    def brute():
+        return closest_in_range_brute(tx, ty, ranges, ex, ey)
+
+    if not np.array_equal(hashed(), brute()):
+        raise AssertionError('spatial hash and brute force disagree')
+
+    return {
+        'enemies': num_enemies,
+        'towers': num_towers,
+        'hash_ms': time_call(hashed, repeat),
+        'brute_ms': time_call(brute, repeat)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--enemies', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--towers', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--width', type=float, default=4000.0, help='world width in pixels')
+    parser.add_argument('--height', type=float, default=3000.0, help='world height in pixels')
+    parser.add_argument('--range', type=float, default=150.0, help='tower range in pixels')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'enemies':>8} {'towers':>7} {'hash ms':>9} {'brute ms':>9} {'speedup':>8}")
+    for num_towers in args.towers:
+        for num_enemies in args.enemies:
+            row = run_case(num_enemies, num_towers, args.width, args.height,
+                           args.range, args.repeat, rng)
+            print(f"{row['enemies']:>8} {row['towers']:>7} {row['hash_ms']:>9.3f} "
+                  f"{row['brute_ms']:>9.3f} {row['brute_ms'] / row['hash_ms']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,37 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
+from flask import Flask, Response, stream_with_context, render_template, request, jsonify, redirect, url_for, flash, g, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
+import itertools
+import threading
+import time
+from functools import wraps
+from datetime import datetime, timezone
 from modules.map_generator import MapGenerator
+from modules.content_cache import CachedContent, ContentCache, serialize_json
+from modules.progression import ProgressionIndex
+from modules.map_store import MapStore, MapNotFoundError
+from modules import map_wire
+from modules import map_analysis
+from modules.map_grid import MapGrid, check_geometry
+from modules.path_table import build_path_table
+from modules.simulator import WaveSimulator, auto_place_towers
+from modules.simulator.engine import check_dt, wave_size
+from modules.batch_generation import expand_grid, generate_batch, validate_params
+from modules.write_behind import WriteBehindBuffer
+from modules import sqlite_tuning
+from modules.user_cache import UserCache
+from modules.password_pool import PasswordHasher, PasswordPoolBusy
+from modules.leaderboard import Leaderboard
+from modules import metrics
+from modules.metrics import phases
+from modules.request_profiler import KINDS as PROFILE_KINDS, RequestProfiler
+from modules.wave_planner import MAX_WAVE, WavePlanner
+from sqlalchemy import event, inspect, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -12,8 +39,43 @@ app = Flask(__name__)
 # --- Configuration for a secure app and database ---
 # TODO: Change this secret key to a long, random string in production.
 app.config['SECRET_KEY'] = 'your-very-secret-key-that-you-should-change'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
+# DATABASE_URL / MAP_DB_PATH let tools such as the load tests use scratch databases
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///users.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_tuning.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Password hashing runs on its own bounded pool so a burst of logins
+# cannot take the CPU from gameplay requests
+app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+app.config.setdefault('PASSWORD_HASH_MAX_QUEUE', 64)
+app.config.setdefault('PASSWORD_HASH_METHOD', None)  # None: werkzeug's default
+password_hasher = PasswordHasher(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+                                 method=app.config['PASSWORD_HASH_METHOD'])
+
+# Request metrics; with METRICS_DIR set every worker process writes its
+# values there and /metrics reports the sum over all workers
+app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+app.config.setdefault('METRICS_FLUSH_INTERVAL', float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0)))
+metrics_registry = metrics.MetricsRegistry(app.config['METRICS_DIR'],
+                                           flush_interval=app.config['METRICS_FLUSH_INTERVAL'])
+
+# Shared cache for the static game data files
+content_cache = ContentCache()
+PROGRESSION_FILE = 'config/progression.json'
+TOWER_DATA_FILE = 'tower_data/tower_data.json'
+ENEMY_DATA_FILE = 'enemy_data/enemy_data.json'
+
+# All maps live in a SQLite store, seeded once from map_data/maps.json
+# (generated maps are stored as parameters plus seed and expanded on demand)
+map_generator = MapGenerator()
+map_store = MapStore(os.environ.get('MAP_DB_PATH', 'map_data/maps.db'), legacy_json_path='map_data/maps.json',
+                     generator=map_generator)
+
+
+def get_progression():
+    """Return the compiled progression model, rebuilt when the file changes"""
+    return content_cache.derive(PROGRESSION_FILE, 'progression_index', ProgressionIndex)
 
 # Initialize database and login manager
 db = SQLAlchemy(app)
@@ -21,6 +83,26 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', sqlite_tuning.apply_pragmas)
+    # Statement execution counts as the request's db phase
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: phases.enter('db'))
+    event.listen(db.engine, 'after_cursor_execute', lambda *args: phases.exit())
+    event.listen(db.engine, 'handle_error', lambda context: phases.exit())
+
+# Tower every new player starts with
+DEFAULT_TOWER = 'basic'
+
+
+class TowerUnlock(db.Model):
+    """One unlocked tower of a user, replacing the old JSON list column"""
+    __tablename__ = 'tower_unlock'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    tower_id = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, nullable=False)  # unlock order
+
+
 # ...existing code...
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -35,51 +117,480 @@ class User(UserMixin, db.Model):
     lives = db.Column(db.Integer, nullable=False, default=20)
     wave = db.Column(db.Integer, nullable=False, default=1)
     score = db.Column(db.Integer, nullable=False, default=0)
-    unlocked_towers = db.Column(db.String(500), nullable=False, default='["basic"]')  # JSON string of tower IDs
+    # Bumped on every change to the synced game state (delta-sync protocol)
+    state_version = db.Column(db.Integer, nullable=False, default=0)
+    unlocks = db.relationship(TowerUnlock, order_by=TowerUnlock.position, lazy='selectin',
+                              cascade='all, delete-orphan', passive_deletes=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if not self.unlocks:
+            self.unlock_tower(DEFAULT_TOWER)
+
+    @property
+    def unlocked_towers(self):
+        """Unlocked tower IDs in unlock order"""
+        return [unlock.tower_id for unlock in self.unlocks]
+
+    def unlock_tower(self, tower_id):
+        """Unlock tower_id, returning False if it was already unlocked"""
+        if any(unlock.tower_id == tower_id for unlock in self.unlocks):
+            return False
+        self.unlocks.append(TowerUnlock(tower_id=tower_id, position=len(self.unlocks)))
+        return True
     
     def add_xp(self, amount):
-        """Add XP and handle level ups"""
+        """Add XP and handle level ups (several at once for large gains)"""
+        progression = get_progression()
+        old_level, old_xp = self.level, self.xp
         self.xp += amount
-        with open('config/progression.json', 'r') as f:
-            progression = json.load(f)
         
         # Check for level up
-        next_level = self.level + 1
-        next_level_data = next((x for x in progression['levels'] if x['level'] == next_level), None)
-        
-        if next_level_data and self.xp >= next_level_data['xp_required']:
-            self.level = next_level
-            self._update_unlocked_towers(progression['tower_unlocks'])
+        new_level = progression.level_for_xp(self.xp, self.level)
+        if new_level > old_level:
+            self.level = new_level
+            self._update_unlocked_towers(progression, old_level, old_xp)
             return True
         return False
     
-    def _update_unlocked_towers(self, tower_unlocks):
-        """Update available towers based on level and XP"""
-        current_towers = json.loads(self.unlocked_towers)
-        for tower_id, requirements in tower_unlocks.items():
-            if (self.level >= requirements['level_required'] and 
-                self.xp >= requirements['xp_required'] and 
-                tower_id not in current_towers):
-                current_towers.append(tower_id)
-        self.unlocked_towers = json.dumps(current_towers)
-
-    # Method to set a hashed password
+    def _update_unlocked_towers(self, progression, old_level, old_xp):
+        """Unlock towers that became reachable since (old_level, old_xp)"""
+        for tower_id in progression.newly_unlocked(old_level, old_xp, self.level, self.xp):
+            self.unlock_tower(tower_id)
+
+    # Method to set a hashed password (hashed on the password pool)
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
-    # Method to check a password
+    # Method to check a password, upgrading hashes made with old parameters
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+            db.session.commit()
+            password_hasher.record_rehash()
+        return True
+
+
+# Leaderboard order (score descending, then registration order), globally and per map
+db.Index('ix_user_score_rank', User.score.desc(), User.id)
+db.Index('ix_user_map_score_rank', User.selected_map, User.score.desc(), User.id)
+
+
+def init_db():
+    """Create missing tables and migrate columns from earlier releases"""
+    db.create_all()
+    # create_all() leaves existing tables alone, so add indexes introduced later
+    for index in User.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    columns = {column['name'] for column in inspect(db.engine).get_columns(User.__tablename__)}
+    if 'state_version' not in columns:
+        db.session.execute(text(
+            f'ALTER TABLE "{User.__tablename__}" ADD COLUMN state_version INTEGER NOT NULL DEFAULT 0'
+        ))
+        db.session.commit()
+    if 'unlocked_towers' in columns:
+        migrate_unlocked_towers()
+
+
+def migrate_unlocked_towers():
+    """Move the JSON unlocked_towers column into tower_unlock rows and drop it"""
+    rows = db.session.execute(text(f'SELECT id, unlocked_towers FROM "{User.__tablename__}"')).all()
+    unlocks = []
+    for user_id, raw in rows:
+        try:
+            tower_ids = json.loads(raw) or [DEFAULT_TOWER]
+        except (TypeError, ValueError):
+            tower_ids = [DEFAULT_TOWER]
+        for position, tower_id in enumerate(dict.fromkeys(tower_ids)):
+            unlocks.append({'user_id': user_id, 'tower_id': tower_id, 'position': position})
+    if unlocks:
+        db.session.execute(text(
+            'INSERT OR IGNORE INTO tower_unlock (user_id, tower_id, position) '
+            'VALUES (:user_id, :tower_id, :position)'
+        ), unlocks)
+    db.session.commit()
+    # Committed first: the drop runs on its own connection, and a rerun after a
+    # failed drop inserts nothing new (INSERT OR IGNORE)
+    sqlite_tuning.drop_column(db.engine, User.__table__, 'unlocked_towers')
+
+
+# --- Write-behind buffer for frequently pushed player state ---
+# Fields the client pushes during play; they are coalesced per user and
+# written in batched transactions instead of one commit per request.
+# Each flush bumps the user's state_version in the same UPDATE.
+# The buffer lives in one worker process and acknowledges legacy
+# unversioned writes before they reach the database: a crash loses up to
+# WRITE_BEHIND_INTERVAL seconds of them, and between workers the last flush
+# wins. Versioned deltas are group committed through the same buffer: each
+# request waits for the flush that carries its compare-and-set UPDATE and
+# answers from its result (see apply_state_changes).
+BUFFERED_USER_FIELDS = ('selected_map', 'gold', 'lives', 'wave', 'score')
+app.config.setdefault('WRITE_BEHIND_INTERVAL', 1.0)
+app.config.setdefault('WRITE_BEHIND_MAX_PENDING', 200)
+
+
+def chain_versioned_writes(writes, version):
+    """
+    Accept, in order, each write whose base version is the version reached
+    so far (starting at version); writes with fields bump it by one.
+    Returns the merged fields of the accepted writes and the final version.
+    """
+    merged = {}
+    for write in writes:
+        write.accepted = write.base_version == version
+        if write.accepted and write.fields:
+            merged.update(write.fields)
+            version += 1
+        write.version = version
+    for write in writes:
+        if not write.accepted:
+            write.version = version
+    return merged, version
+
+
+def apply_versioned_writes(user_id, writes):
+    """
+    Apply one user's queued versioned writes in the current transaction, as a
+    single UPDATE that only matches while state_version is the version the
+    accepted writes were chained from. The first write's base is tried first;
+    on a miss the chain is rebuilt from the stored version.
+    """
+    version = writes[0].base_version
+    while True:
+        merged, new_version = chain_versioned_writes(writes, version)
+        if merged:
+            result = db.session.execute(
+                update(User)
+                .where(User.id == user_id, User.state_version == version)
+                .values(state_version=new_version, **merged)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                return
+        stored = db.session.execute(
+            select(User.state_version).where(User.id == user_id)
+        ).scalar_one_or_none()
+        if stored is None:
+            for write in writes:
+                write.accepted = False
+            return
+        if stored == version and not merged:
+            return
+        version = stored
+
+
+def flush_user_updates(batch, writes):
+    """
+    Write one batch in a single transaction: every user's buffered fields
+    (bumping the version), then every user's versioned writes in order
+    """
+    with app.app_context():
+        for user_id, fields in batch.items():
+            db.session.execute(
+                update(User).where(User.id == user_id)
+                .values(state_version=User.state_version + 1, **fields)
+            )
+        for user_id, user_writes in writes.items():
+            apply_versioned_writes(user_id, user_writes)
+        db.session.commit()
+    for user_id in batch.keys() | writes.keys():
+        user_cache.invalidate(user_id)
+
+
+user_write_buffer = WriteBehindBuffer(flush_user_updates,
+                                      interval=app.config['WRITE_BEHIND_INTERVAL'],
+                                      max_pending=app.config['WRITE_BEHIND_MAX_PENDING'])
+
+
+def buffer_user_update(user, fields):
+    """Queue buffered fields for user and show them on the loaded instance right away"""
+    fields = {k: v for k, v in fields.items() if k in BUFFERED_USER_FIELDS}
+    if 'score' in fields or 'selected_map' in fields:
+        # Before queueing, so a score the leaderboard rejects is never written
+        leaderboard.update(user.id, fields.get('score', user.score),
+                           fields.get('selected_map', user.selected_map))
+    user_write_buffer.update(user.id, fields)
+    for key, value in fields.items():
+        # Not marked dirty, so a commit in this request does not write them twice
+        set_committed_value(user, key, value)
+
+
+# --- Leaderboard ---
+# Kept in memory per worker and updated on every score write; it is rebuilt
+# from the database on first use and every LEADERBOARD_RESYNC seconds to pick
+# up writes made by other workers.
+app.config.setdefault('LEADERBOARD_RESYNC', 300.0)
+leaderboard = Leaderboard()
+_leaderboard_loaded_at = None
+_leaderboard_lock = threading.Lock()
+
+
+def _leaderboard_rows():
+    """(id, score, selected_map) for every user"""
+    # Buffered scores are written first so the rebuild does not miss them
+    user_write_buffer.flush()
+    # Read in full so the app context is popped here, not by whoever exhausts a generator
+    with app.app_context():
+        return db.session.execute(select(User.id, User.score, User.selected_map)).all()
+
+
+def _resync_leaderboard():
+    global _leaderboard_loaded_at
+    try:
+        leaderboard.load(_leaderboard_rows())
+        _leaderboard_loaded_at = time.monotonic()
+    finally:
+        _leaderboard_lock.release()
+
+
+def get_leaderboard():
+    """Return the leaderboard, loading it on first use and resyncing it when stale"""
+    global _leaderboard_loaded_at
+    if _leaderboard_loaded_at is None:
+        with _leaderboard_lock:
+            if _leaderboard_loaded_at is None:
+                leaderboard.load(_leaderboard_rows())
+                _leaderboard_loaded_at = time.monotonic()
+    elif time.monotonic() - _leaderboard_loaded_at > app.config['LEADERBOARD_RESYNC']:
+        # Rebuild in the background and keep serving the current boards meanwhile
+        if _leaderboard_lock.acquire(blocking=False):
+            threading.Thread(target=_resync_leaderboard, name='leaderboard-resync', daemon=True).start()
+    return leaderboard
+
+
+# --- Per-worker cache of user rows for load_user ---
+# Every write to a user bumps state_version, so a hit is checked against the
+# stored version (one primary key lookup) and writes made by other workers
+# are seen on the next request rather than after the TTL.
+app.config.setdefault('USER_CACHE_SIZE', 1024)
+app.config.setdefault('USER_CACHE_TTL', 30.0)
+user_cache = UserCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_user_writes(session, flush_context):
+    """Remember which users this transaction wrote"""
+    written = session.info.setdefault('written_user_ids', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            written.add(obj.id)
+        elif isinstance(obj, TowerUnlock):
+            written.add(obj.user_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_written_users(session):
+    # Only after commit, so a concurrent load cannot cache the old row again
+    for user_id in session.info.pop('written_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_written_users(session):
+    session.info.pop('written_user_ids', None)
+
+
+def _load_detached_user(user_id):
+    """Load a user (with unlocks) in a short session and detach it for the cache"""
+    with Session(db.engine, expire_on_commit=False) as session:
+        user = session.get(User, user_id)
+        if user is not None:
+            session.expunge(user)
+        return user
+
+
+def _stored_state_version(user_id):
+    return db.session.execute(select(User.state_version).where(User.id == user_id)).scalar()
 
 
 # --- CORRECTED: User loader callback for Flask-Login (uses modern SQLAlchemy) ---
 @login_manager.user_loader
 def load_user(user_id):
     """
-    This function is required by Flask-Login. It loads a user from the
-    database by their ID. The modern SQLAlchemy way is to use db.session.get().
+    This function is required by Flask-Login. It loads a user by their ID,
+    from the per-worker user cache when possible. The cached row is detached;
+    each request gets its own copy merged into its session, and a hit only
+    costs a state_version lookup instead of loading the row and its unlocks.
     """
-    return db.session.get(User, int(user_id))
+    user_id = int(user_id)
+    cached = user_cache.get_or_load(user_id, lambda: _load_detached_user(user_id),
+                                    is_current=lambda user: user.state_version == _stored_state_version(user_id))
+    if cached is None:
+        return None
+    user = db.session.merge(cached, load=False)
+    if user is not None:
+        # Overlay values that are still waiting in the write-behind buffer
+        for key, value in user_write_buffer.pending(user.id).items():
+            set_committed_value(user, key, value)
+    return user
+
+
+# --- Request instrumentation ---
+REQUEST_LATENCY = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Request latency per route', ('method', 'endpoint'))
+REQUESTS = metrics_registry.counter(
+    'http_requests', 'Requests per route and status code', ('method', 'endpoint', 'status'))
+REQUEST_PHASES = metrics_registry.histogram(
+    'http_request_phase_seconds', 'Time per request spent in DB queries, file I/O and JSON serialization',
+    ('endpoint', 'phase'))
+RESPONSE_SIZE = metrics_registry.histogram(
+    'http_response_size_bytes', 'Response body size per route', ('endpoint',), buckets=metrics.SIZE_BUCKETS)
+REQUEST_EXCEPTIONS = metrics_registry.counter(
+    'http_request_exceptions', 'Exceptions caught while handling a request', ('endpoint', 'exception'))
+MAP_GENERATION = metrics_registry.histogram(
+    'map_generation_duration_seconds', 'MapGenerator run time per size and complexity',
+    ('size', 'complexity'))
+REQUEST_PHASE_NAMES = ('db', 'file_io', 'json')
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with its work counted in the request's json phase"""
+
+    def dumps(self, obj, **kwargs):
+        with phases.time('json'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with phases.time('json'):
+            return super().loads(s, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+
+def endpoint_label():
+    """Route pattern of the current request (bounded cardinality, unlike the path)"""
+    return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+def record_exception(e):
+    """Log an exception a route handled itself and count it"""
+    app.logger.exception('Error in %s', request.path)
+    REQUEST_EXCEPTIONS.inc(endpoint_label(), type(e).__name__)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    phases.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    spent = phases.stop()
+    endpoint = endpoint_label()
+    REQUEST_LATENCY.observe(elapsed, request.method, endpoint)
+    REQUESTS.inc(request.method, endpoint, str(response.status_code))
+    for phase in REQUEST_PHASE_NAMES:
+        REQUEST_PHASES.observe(spent.get(phase, 0.0), endpoint, phase)
+    # Streamed responses have no length up front
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, endpoint)
+    metrics_registry.maybe_flush()
+    return response
+
+@app.teardown_request
+def record_unhandled_exception(exc):
+    if exc is not None:
+        REQUEST_EXCEPTIONS.inc(endpoint_label(), type(exc).__name__)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of all request and generator metrics"""
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# --- Opt-in request profiling ---
+# Admins (ADMIN_USERNAMES, comma separated) can profile a single request by
+# sending the X-Profile header; PROFILE_SAMPLE_RATE profiles a share of all
+# requests. Captures go to PROFILE_DIR, keeping the newest PROFILE_KEEP.
+app.config.setdefault('ADMIN_USERNAMES', {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',')
+                                          if name.strip()})
+app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', 'profiles'))
+app.config.setdefault('PROFILE_KEEP', 50)
+app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0)))
+request_profiler = RequestProfiler(app.config['PROFILE_DIR'], keep=app.config['PROFILE_KEEP'],
+                                   sample_rate=app.config['PROFILE_SAMPLE_RATE'])
+PROFILE_HEADER = 'X-Profile'
+
+
+def is_admin():
+    return current_user.is_authenticated and current_user.username in app.config['ADMIN_USERNAMES']
+
+def admin_required(view):
+    """login_required plus membership in ADMIN_USERNAMES (403 otherwise)"""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def start_request_profile():
+    if request.headers.get(PROFILE_HEADER) and is_admin():
+        trigger = 'header'
+    elif request_profiler.sampled():
+        trigger = 'sample'
+    else:
+        return
+    profile = request_profiler.start()
+    if profile is not None:
+        g.request_profile = (profile, trigger, time.perf_counter())
+
+@app.after_request
+def finish_request_profile(response):
+    """Write the capture; its name is returned in X-Profile-Id (streamed bodies are not covered)"""
+    pending = g.pop('request_profile', None)
+    if pending is None:
+        return response
+    profile, trigger, started = pending
+    name = request_profiler.finish(profile, {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': endpoint_label(),
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        'trigger': trigger,
+        'user': current_user.username if current_user.is_authenticated else None
+    })
+    response.headers['X-Profile-Id'] = name
+    return response
+
+@app.teardown_request
+def discard_request_profile(exc):
+    # Only left over when the response was never finalized
+    pending = g.pop('request_profile', None)
+    if pending is not None:
+        request_profiler.discard(pending[0])
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """Captured request profiles, newest first"""
+    return jsonify({
+        'status': 'success',
+        'profiles': request_profiler.captures(),
+        'sample_rate': request_profiler.sample_rate,
+        'keep': request_profiler.keep
+    })
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+@admin_required
+def download_profile(name):
+    """
+    One capture: ?format=prof (default, raw cProfile stats for pstats or
+    snakeviz), txt (top functions) or json (request details).
+    """
+    kind = request.args.get('format', 'prof')
+    path = request_profiler.path(name, kind)
+    if path is None:
+        return jsonify({'status': 'error', 'message': f'Profile {name}.{kind} not found'}), 404
+    return send_file(os.path.abspath(path), mimetype=PROFILE_KINDS[kind],
+                     as_attachment=kind == 'prof', download_name=f'{name}.{kind}')
 
 
 # --- Routes for user authentication ---
@@ -93,7 +604,13 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordPoolBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('login.html'), 503
+        
+        if valid:
             login_user(user)
             # Redirect to the page the user was trying to access
             next_page = request.args.get('next')
@@ -118,10 +635,15 @@ def register():
             return redirect(url_for('register'))
         
         new_user = User(username=username)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordPoolBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('register.html'), 503
         
         db.session.add(new_user)
         db.session.commit()
+        leaderboard.update(new_user.id, new_user.score, new_user.selected_map)
         
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('login'))
@@ -131,6 +653,7 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    user_write_buffer.flush()
     logout_user()
     return redirect(url_for('index'))
 
@@ -171,107 +694,375 @@ def credits():
 
 
 # --- API endpoints, now linked to the database ---
+def etag_response(entry):
+    """
+    Serve a pre-serialized cache entry with its strong ETag.
+    Clients sending a matching If-None-Match get a 304 without a body.
+    """
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def cached_json_response(path):
+    """Serve a game data file from the content cache"""
+    return etag_response(content_cache.get(path))
+
+# Encoded map bodies per (map or snapshot, format, content encoding)
+map_representations = map_wire.RepresentationCache(maxsize=512)
+
+def negotiate_map_format():
+    """
+    Pick (format, encoding) for a map response.
+    ?format=json|compact|binary wins over the Accept header; the encoding
+    follows Accept-Encoding (br if available, then gzip, else identity).
+    Returns (None, None) for an unknown format.
+    """
+    fmt = request.args.get('format')
+    if fmt is None:
+        media_type = request.accept_mimetypes.best_match(list(map_wire.MEDIA_TYPES.values()),
+                                                         default=map_wire.MEDIA_TYPES['json'])
+        fmt = map_wire.FORMAT_BY_MEDIA_TYPE[media_type]
+    if fmt not in map_wire.MEDIA_TYPES:
+        return None, None
+    encoding = request.accept_encodings.best_match(map_wire.ENCODINGS)
+    return fmt, encoding
+
+def requested_map_fields():
+    """Optional map fields (map_wire.OPTIONAL_FIELDS) asked for with ?include=a,b"""
+    names = request.args.get('include', '').split(',')
+    return tuple(name for name in map_wire.OPTIONAL_FIELDS if name in names)
+
+def representation_response(representation):
+    """Serve an encoded map body with its ETag (304 on a matching If-None-Match)"""
+    response = Response(representation.body, mimetype=representation.mimetype)
+    if representation.encoding:
+        response.headers['Content-Encoding'] = representation.encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    response.set_etag(representation.etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def unsupported_format_response():
+    return jsonify({
+        'status': 'error',
+        'message': f'Unsupported format, use one of {sorted(map_wire.MEDIA_TYPES)}'
+    }), 406
+
 @app.route('/api/maps', methods=['GET'])
 def get_maps():
-    """Returns the map data from a JSON file."""
-    return send_file('map_data/maps.json')
+    """Returns all maps from the map store (path tables only with ?include=path_table)."""
+    fmt, encoding = negotiate_map_format()
+    if fmt is None:
+        return unsupported_format_response()
+    include = requested_map_fields()
+    snapshot = map_store.snapshot()
+    if fmt == 'json' and encoding is None:
+        response = etag_response(map_store.snapshot(include))
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        return response
+    representation = map_representations.get(
+        ('maps', snapshot.etag, include), fmt, encoding,
+        lambda fmt: map_wire.serialize(snapshot.data, fmt, include)
+    )
+    return representation_response(representation)
+
+# --- Versioned game state sync ---
+# Clients send {"version": <last seen>, "changes": {...}} with only the fields
+# that changed. Writes based on an older version are rejected with 409, and
+# GETs answer 304 while the version (ETag) is unchanged.
+SYNCED_STATE_FIELDS = ('selected_map', 'gold', 'lives', 'wave', 'score')
+# Largest value of the integer state columns (and of leaderboard scores)
+MAX_STATE_VALUE = 2 ** 31 - 1
+
+
+class StaleStateError(Exception):
+    """Raised when a delta is based on an outdated state version"""
+
+    def __init__(self, current_version):
+        super().__init__(f'State version is {current_version}')
+        self.current_version = current_version
+
+
+def current_state_version(user):
+    """State version as stored in the database"""
+    return db.session.execute(
+        select(User.state_version).where(User.id == user.id)
+    ).scalar_one()
+
+
+def flush_pending_state(user):
+    """
+    Write user's queued legacy updates now, so the version (ETag) a read
+    returns covers them.
+    """
+    if user_write_buffer.pending(user.id):
+        user_write_buffer.flush()
+        set_committed_value(user, 'state_version', current_state_version(user))
+
+
+def apply_state_changes(user, changes, base_version=None):
+    """
+    Apply the fields of changes that differ from the current state.
+    With a base_version the fields and the version bump are group committed
+    through the write-behind buffer: the flush writes them with an UPDATE
+    that only matches while state_version is still base_version, so the
+    database decides between concurrent writers in every worker, and this
+    call waits for that flush. A miss raises StaleStateError. Legacy writes
+    without a version are only queued, and their flush bumps the version.
+    Returns (changed fields, new version, or None while the write is queued).
+    """
+    pending = user_write_buffer.pending(user.id)
+    changed = {
+        key: value for key, value in changes.items()
+        if key in SYNCED_STATE_FIELDS and pending.get(key, getattr(user, key)) != value
+    }
+    if base_version is None:
+        buffer_user_update(user, changed)
+        return changed, (None if changed else user.state_version)
+
+    # Unchanged deltas still go through the flush, as a version check
+    write = user_write_buffer.write_versioned(user.id, changed, base_version)
+    if not write.accepted:
+        raise StaleStateError(write.version)
+    for key, value in dict(changed, state_version=write.version).items():
+        set_committed_value(user, key, value)
+    if 'score' in changed or 'selected_map' in changed:
+        leaderboard.update(user.id, user.score, user.selected_map)
+    return changed, write.version
+
+
+def versioned_response(payload, version):
+    """JSON response whose ETag is the user's state version"""
+    response = jsonify(dict(payload, version=version))
+    response.set_etag(f'state-{current_user.id}-{version}')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def conflict_response(error, state):
+    return jsonify({
+        'status': 'conflict',
+        'message': 'State changed since the given version',
+        'version': error.current_version,
+        'state': state
+    }), 409
+
+
+def check_state_int(name, value, maximum=MAX_STATE_VALUE, minimum=0):
+    """Return value if it is an int in [minimum, maximum], else raise ValueError"""
+    if isinstance(value, bool) or not isinstance(value, int) or not minimum <= value <= maximum:
+        raise ValueError(f'{name} must be an integer between {minimum} and {maximum}')
+    return value
+
+
+def parse_state_update(data, renames=None):
+    """
+    Split a POST body into (changes, base_version).
+    Delta bodies carry "changes" and "version"; legacy full-state bodies
+    without a version are applied without a version check.
+    Raises ValueError for malformed bodies and out-of-range or unknown
+    values, so nothing is written for them.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Invalid data')
+    changes = data.get('changes', data)
+    if not isinstance(changes, dict):
+        raise ValueError('Invalid data')
+    changes = {(renames or {}).get(key, key): value for key, value in changes.items()}
+    for key, value in changes.items():
+        if key == 'selected_map':
+            if not isinstance(value, str) or not map_store.has_map(value):
+                raise ValueError(f'Unknown map: {value}')
+        elif key in SYNCED_STATE_FIELDS:
+            check_state_int(key, value)
+
+    base_version = data.get('version')
+    if base_version is not None:
+        check_state_int('version', base_version)
+    return changes, base_version
+
+
+def player_state():
+    return {
+        "health": 100, # This is a temporary value, not stored
+        "gold": current_user.gold,
+        "lives": current_user.lives,
+        "current_wave": current_user.wave,
+        "score": current_user.score,
+        "username": current_user.username
+    }
+
+
+def gamestate():
+    return {
+        'player_name': current_user.username,
+        'selected_map': current_user.selected_map,
+        'gold': current_user.gold,
+        'lives': current_user.lives,
+        'wave': current_user.wave,
+        'score': current_user.score,
+        'level': current_user.level,
+        'xp': current_user.xp,
+        'unlocked_towers': current_user.unlocked_towers
+    }
+
 
 @app.route('/api/player', methods=['GET', 'POST'])
 @login_required
 def player_data():
     """
-    Handles GET/POST requests for the current user's player data,
-    loading and saving directly to the database.
+    Handles GET/POST requests for the current user's player data.
+    POST accepts {"version": n, "changes": {...}} deltas (see apply_state_changes).
     """
     if request.method == 'GET':
-        return jsonify({
-            "health": 100, # This is a temporary value, not stored
-            "gold": current_user.gold,
-            "lives": current_user.lives,
-            "current_wave": current_user.wave,
-            "score": current_user.score,
-            "username": current_user.username
-        })
+        flush_pending_state(current_user)
+        return versioned_response(player_state(), current_user.state_version)
     elif request.method == 'POST':
-        data = request.get_json()
-        
-        # Update user attributes from the POST data
-        current_user.gold = data.get('gold', current_user.gold)
-        current_user.lives = data.get('lives', current_user.lives)
-        current_user.wave = data.get('current_wave', current_user.wave)
-        current_user.score = data.get('score', current_user.score)
+        data = request.get_json(silent=True)
+        try:
+            changes, base_version = parse_state_update(data, renames={'current_wave': 'wave'})
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
-        db.session.commit()
-        return jsonify({"status": "Updated", "data": data})
+        # Update user attributes from the POST data (written behind)
+        try:
+            changed, version = apply_state_changes(current_user, changes, base_version)
+        except StaleStateError as e:
+            return conflict_response(e, player_state())
+        return jsonify({"status": "Updated", "data": data, "changed": sorted(changed), "version": version})
 
 
 @app.route('/api/gamestate', methods=['GET', 'POST'])
 @login_required
 def gamestate_api():
     if request.method == 'GET':
-        gamestate_data = {
-            'player_name': current_user.username,
-            'selected_map': current_user.selected_map,
-            'gold': current_user.gold,
-            'lives': current_user.lives,
-            'wave': current_user.wave,
-            'score': current_user.score,
-            'level': current_user.level,
-            'xp': current_user.xp,
-            'unlocked_towers': json.loads(current_user.unlocked_towers)
-        }
-        return jsonify(gamestate_data)
+        flush_pending_state(current_user)
+        return versioned_response(gamestate(), current_user.state_version)
     elif request.method == 'POST':
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        try:
+            changes, base_version = parse_state_update(data)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
-        # Update user attributes from the POST data
-        if 'selected_map' in data:
-            current_user.selected_map = data['selected_map']
-        
-        # Also update other fields that might be sent in the gamestate post
-        current_user.gold = data.get('gold', current_user.gold)
-        current_user.lives = data.get('lives', current_user.lives)
-        current_user.wave = data.get('wave', current_user.wave)
-        current_user.score = data.get('score', current_user.score)
-
-        db.session.commit()
+        # Update user attributes from the POST data (written behind)
+        try:
+            changed, version = apply_state_changes(current_user, changes, base_version)
+        except StaleStateError as e:
+            return conflict_response(e, gamestate())
         return jsonify({
             "status": "Updated", 
             "gamestate": {
                 'player_name': current_user.username,
                 'selected_map': current_user.selected_map
-            }
+            },
+            "changed": sorted(changed),
+            "version": version
         })
 
 
+@app.route('/api/leaderboard', methods=['GET'])
+@login_required
+def get_leaderboard_page():
+    """
+    One page of the leaderboard, global or for one map (?map=<selected_map>).
+    Paginate with ?offset=&limit= (1..100, default 20), or pass ?around=me
+    for the page centred on the current user. "me" holds the user's rank.
+    """
+    map_id = request.args.get('map') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'offset and limit must be integers'}), 400
+
+    board = get_leaderboard()
+    my_rank = board.rank(current_user.id, map_id)
+    if request.args.get('around') == 'me' and my_rank is not None:
+        offset = max(0, my_rank - 1 - limit // 2)
+
+    page, total = board.page(offset, limit, map_id)
+    users = {}
+    if page:
+        rows = db.session.execute(
+            select(User.id, User.username, User.level, User.wave)
+            .where(User.id.in_([user_id for _, user_id, _ in page]))
+        )
+        users = {row.id: row for row in rows}
+
+    entries = []
+    for rank, user_id, score in page:
+        row = users.get(user_id)
+        entries.append({
+            'rank': rank,
+            'username': row.username if row else None,
+            'score': score,
+            'level': row.level if row else None,
+            'wave': row.wave if row else None
+        })
+    return jsonify({
+        'status': 'success',
+        'board': map_id or 'global',
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'entries': entries,
+        'me': {'rank': my_rank, 'score': current_user.score}
+    })
+
+
+@app.route('/api/user-cache', methods=['GET'])
+@login_required
+def user_cache_stats():
+    """Hit/miss counters of the load_user cache ("stale": hits that another worker had outdated)"""
+    return jsonify(user_cache.stats())
+
+
+@app.route('/api/password-pool', methods=['GET'])
+@login_required
+def password_pool_stats():
+    """Queue time and job counts of the password hashing pool"""
+    return jsonify(password_hasher.stats())
+
+
+@app.route('/api/write-buffer', methods=['GET'])
+@login_required
+def write_buffer_stats():
+    """Queue depth and flush latency of the player state write-behind buffer"""
+    return jsonify(user_write_buffer.stats())
+
+
+def progression_state():
+    """Current user's level, XP and unlocks with the data for their level"""
+    return {
+        'current_level': current_user.level,
+        'current_xp': current_user.xp,
+        'unlocked_towers': current_user.unlocked_towers,
+        'level_data': get_progression().level_data(current_user.level)
+    }
+
+
 @app.route('/api/progression', methods=['GET', 'POST'])
 @login_required
 def progression():
     """Handle progression-related requests"""
     if request.method == 'GET':
-        # Load progression template
-        with open('config/progression.json', 'r') as f:
-            progression_data = json.load(f)
-        
-        # Get current level data
-        current_level_data = next(
-            (x for x in progression_data['levels'] if x['level'] == current_user.level), 
-            None
-        )
-        
-        return jsonify({
-            'current_level': current_user.level,
-            'current_xp': current_user.xp,
-            'unlocked_towers': json.loads(current_user.unlocked_towers),
-            'level_data': current_level_data
-        })
+        return jsonify(progression_state())
     
     elif request.method == 'POST':
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Handle XP gain
-        if 'xp_gained' in data:
-            level_up = current_user.add_xp(data['xp_gained'])
+        if isinstance(data, dict) and 'xp_gained' in data:
+            try:
+                xp_gained = check_state_int('xp_gained', data['xp_gained'], MAX_STATE_VALUE - current_user.xp)
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+            level_up = current_user.add_xp(xp_gained)
+            # Bumped in the same UPDATE so other sessions notice the new level
+            current_user.state_version = User.state_version + 1
             
             # Save changes
             db.session.commit()
@@ -281,32 +1072,232 @@ def progression():
                 'level_up': level_up,
                 'new_level': current_user.level,
                 'new_xp': current_user.xp,
-                'unlocked_towers': json.loads(current_user.unlocked_towers)
+                'unlocked_towers': current_user.unlocked_towers
             })
 
-        return jsonify({'status': 'error', 'message': 'Invalid data'})
+        return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
 
 
 
 @app.route('/api/towers', methods=['GET'])
 def get_towers():
     """Returns the tower data from a JSON file."""
-    with open('tower_data/tower_data.json', 'r') as f:
-        tower_data = json.load(f)
-    return jsonify(tower_data)
+    return cached_json_response(TOWER_DATA_FILE)
 
 
 @app.route('/api/enemies', methods=['GET'])
 def get_enemies():
     """Returns the enemy data from a JSON file."""
-    with open('enemy_data/enemy_data.json', 'r') as f:
-        enemy_data = json.load(f)
-    return jsonify(enemy_data)
+    return cached_json_response(ENEMY_DATA_FILE)
+
+
+# --- Wave spawn schedules ---
+# Waves precomputed per level; later waves are planned on request
+WAVE_TABLE_SIZE = 100
+# Upper bound on waves per /api/waves request
+MAX_WAVE_SPAN = 100
+_wave_planner = None
+
+def get_wave_planner():
+    """The wave planner for the current enemy and progression files, rebuilt when either changes"""
+    global _wave_planner
+    enemies = content_cache.get(ENEMY_DATA_FILE)
+    progression_file = content_cache.get(PROGRESSION_FILE)
+    version = (enemies.etag, progression_file.etag)
+
+    planner = _wave_planner
+    if planner is None or planner.version != version:
+        planner = WavePlanner(enemies.data, progression_file.data, table_size=WAVE_TABLE_SIZE,
+                              version=version)
+        _wave_planner = planner
+    return planner
+
+@app.route('/api/waves/<spec>', methods=['GET'])
+@login_required
+def get_waves(spec):
+    """
+    Spawn schedules for wave <n> or waves <first>-<last> (at most MAX_WAVE_SPAN),
+    for the current user's level or ?level=. Every spawn lists its enemy group
+    (type, hp, speed, reward) and time, so the client does no scaling math.
+    The body supports byte Range requests and ETag revalidation.
+    """
+    try:
+        first, _, last = spec.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        level = int(request.args.get('level', current_user.level))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Use /api/waves/<n> or /api/waves/<first>-<last>'}), 400
+    if last - first + 1 > MAX_WAVE_SPAN:
+        return jsonify({'status': 'error', 'message': f'At most {MAX_WAVE_SPAN} waves per request'}), 400
+
+    planner = get_wave_planner()
+    try:
+        body = planner.waves(level, first, last)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    response = Response(body, mimetype='application/json')
+    sources = ''.join(etag[:8] for etag in planner.version)
+    response.set_etag(f'waves-{sources}-{planner.plan_level(level)}-{first}-{last}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+
+
+# --- Aggregated game start payload ---
+# Shared part of the payload per tuple of included optional map fields
+_bootstrap_static = {}
+
+def bootstrap_static(include=()):
+    """
+    Pre-serialized shared part of /api/bootstrap (maps, towers, enemies),
+    with the optional map fields in include.
+    Rebuilt only when one of its sources changes.
+    """
+    maps = map_store.snapshot(include)
+    towers = content_cache.get(TOWER_DATA_FILE)
+    enemies = content_cache.get(ENEMY_DATA_FILE)
+    progression_file = content_cache.get(PROGRESSION_FILE)
+    version = (maps.etag, towers.etag, enemies.etag, progression_file.etag)
+
+    entry = _bootstrap_static.get(include)
+    if entry is None or entry.version != version:
+        body = b''.join([b'{"maps":', maps.body, b',"towers":', towers.body,
+                         b',"enemies":', enemies.body, b'}'])
+        entry = CachedContent('bootstrap', None, body, version)
+        _bootstrap_static[include] = entry
+    return entry
+
+@app.route('/api/bootstrap', methods=['GET'])
+@login_required
+def bootstrap():
+    """
+    Everything the game needs before its first frame, in one response:
+    {"static": {maps, towers, enemies}, "static_etag": ..., "user": {player, progression}}.
+    Pass ?static_etag=<etag> from an earlier response to get only the user
+    section while the static part is unchanged ("static" is then null), and
+    ?include=path_table for the maps' path tables.
+    """
+    static = bootstrap_static(requested_map_fields())
+    static_etag = static.etag[:32]
+    include_static = request.args.get('static_etag') != static_etag
+    flush_pending_state(current_user)
+    version = current_user.state_version
+    user = {
+        'player': dict(player_state(), version=version),
+        'progression': progression_state()
+    }
+
+    # The shared part is spliced in as bytes, only the user part is serialized per request
+    body = b''.join([b'{"static":', static.body if include_static else b'null',
+                     b',"static_etag":', serialize_json(static_etag),
+                     b',"user":', serialize_json(user), b'}'])
+    response = Response(body, mimetype='application/json')
+    scope = 'full' if include_static else 'user'
+    response.set_etag(f'{static_etag[:16]}-{scope}-{current_user.id}-{version}')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# --- Balance simulation ---
+# Upper bounds per request to keep a single call bounded: simulated waves
+# (runs * waves), enemy slots (simulated waves * largest wave) and towers
+MAX_SIMULATED_WAVES = 20000
+MAX_SIMULATED_ENEMIES = 200000
+MAX_SIMULATED_TOWERS = 50
+
+
+def parse_simulation_towers(data, map_data, tower_types):
+    """
+    Return the tower layout of a /api/simulate body: the explicit towers plus
+    any auto-placed ones. Raises ValueError for unknown types, cells outside
+    the map or more than MAX_SIMULATED_TOWERS towers.
+    """
+    towers = data.get('towers', [])
+    if not isinstance(towers, list):
+        raise ValueError('towers must be a list')
+    if len(towers) > MAX_SIMULATED_TOWERS:
+        raise ValueError(f'At most {MAX_SIMULATED_TOWERS} towers per simulation')
+    dimensions = map_data.get('dimensions', {'width': 32, 'height': 24})
+    for i, tower in enumerate(towers):
+        if not isinstance(tower, dict):
+            raise ValueError(f'towers[{i}] must be an object with type, x and y')
+        if tower.get('type') not in tower_types:
+            raise ValueError(f'Unknown tower type: {tower.get("type")!r}')
+        check_state_int(f'towers[{i}].x', tower.get('x'), dimensions['width'] - 1)
+        check_state_int(f'towers[{i}].y', tower.get('y'), dimensions['height'] - 1)
+
+    if 'auto_towers' in data:
+        auto = data['auto_towers']
+        if not isinstance(auto, dict):
+            raise ValueError('auto_towers must be an object')
+        tower_type = auto.get('type', 'basic')
+        if tower_type not in tower_types:
+            raise ValueError(f'Unknown tower type: {tower_type!r}')
+        count = check_state_int('auto_towers.count', auto.get('count', 5),
+                                MAX_SIMULATED_TOWERS - len(towers))
+        towers = towers + auto_place_towers(map_data, tower_type, count)
+    return towers
+
+
+@app.route('/api/simulate', methods=['POST'])
+@login_required
+def simulate():
+    """Run the headless wave simulator on a stored map"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            raise ValueError('Invalid data')
+        
+        map_data = map_store.get(data.get('map_id', 1))
+        if not map_data:
+            return jsonify({'status': 'error', 'message': 'Map not found'}), 404
+        
+        tower_types = content_cache.get('tower_data/tower_data.json').data
+        enemy_types = content_cache.get('enemy_data/enemy_data.json').data
+        
+        towers = parse_simulation_towers(data, map_data, tower_types)
+        
+        waves = data.get('waves', [1])
+        if not isinstance(waves, list) or not waves:
+            raise ValueError('waves must be a non-empty list')
+        for wave in waves:
+            check_state_int('wave', wave, MAX_WAVE, minimum=1)
+        runs = check_state_int('runs', data.get('runs', 100), MAX_SIMULATED_WAVES, minimum=1)
+        if runs * len(waves) > MAX_SIMULATED_WAVES:
+            raise ValueError(f'runs * len(waves) must be at most {MAX_SIMULATED_WAVES}')
+        # Every simulated wave is padded to the largest one
+        if runs * len(waves) * wave_size(max(waves)) > MAX_SIMULATED_ENEMIES:
+            raise ValueError(f'runs * len(waves) * enemies in the largest wave must be at most '
+                             f'{MAX_SIMULATED_ENEMIES}')
+        
+        # Outside MIN_DT..MAX_DT a run could take (almost) forever
+        dt = check_dt(data.get('dt', 0.05))
+        simulator = WaveSimulator(map_data, towers, tower_types, enemy_types,
+                                  content_cache.get(PROGRESSION_FILE).data, dt=dt)
+        seed = data.get('seed')
+        if seed is not None:
+            check_state_int('seed', seed, 2 ** 63 - 1)
+        result = simulator.run(waves, runs=runs, seed=seed, level=data.get('level'))
+        
+        return jsonify({
+            'status': 'success',
+            'towers': towers,
+            'summary': result.summary()
+        })
+        
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        record_exception(e)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 
 # --- Map Generator API Endpoints ---
-# Initialize map generator
-map_generator = MapGenerator()
 
 @app.route('/generator')
 @login_required
@@ -317,7 +1308,7 @@ def generator():
 @app.route('/api/generate-map', methods=['POST'])
 @login_required
 def generate_map():
-    """Generate a new map with specified parameters"""
+    """Generate a new map with specified parameters (path table only with ?include=path_table)"""
     try:
         data = request.get_json()
         
@@ -326,56 +1317,104 @@ def generate_map():
         size = data.get('size', 'medium')
         complexity = data.get('complexity', 'curved')
         custom_name = data.get('name', None)
+        seed = data.get('seed', None)
         
-        # Generate the map
-        generated_map = map_generator.generate_map(
+        # Generate the map (reproducible for a given seed)
+        started = time.perf_counter()
+        generated_map, stats = map_generator.generate_map_with_stats(
             difficulty=difficulty,
             theme=theme,
             size=size,
             complexity=complexity,
-            custom_name=custom_name
+            custom_name=custom_name,
+            seed=int(seed) if seed is not None else None
         )
+        MAP_GENERATION.observe(time.perf_counter() - started, size, complexity)
         
         return jsonify({
             'status': 'success',
-            'map': generated_map
+            'map': map_wire.without_optional(generated_map, requested_map_fields()),
+            'stats': stats
         })
         
     except Exception as e:
+        record_exception(e)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+# Upper bound on maps per batch request
+MAX_BATCH_MAPS = 2000
+
+@app.route('/api/generate-maps-batch', methods=['POST'])
+@login_required
+def generate_maps_batch():
+    """
+    Generate count maps for every combination in a parameter grid, e.g.
+    {"grid": {"difficulty": ["easy", "hard"], "theme": ["forest"]}, "count": 50}.
+    Results are streamed as NDJSON, one map per line, as workers finish them
+    (path tables only with ?include=path_table).
+    """
+    data = request.get_json() or {}
+    try:
+        jobs = expand_grid(data.get('grid', {}), int(data.get('count', 1)), MAX_BATCH_MAPS)
+        validate_params(jobs)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    include = requested_map_fields()
+    
+    def stream():
+        for result in generate_batch(jobs):
+            if result['status'] == 'success':
+                result['map'] = map_wire.without_optional(result['map'], include)
+                params = result['params']
+                MAP_GENERATION.observe(result['generation_ms'] / 1000, params['size'], params['complexity'])
+            yield json.dumps(result, separators=(',', ':')) + '\n'
+    
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
 @app.route('/api/save-custom-map', methods=['POST'])
 @login_required
 def save_custom_map():
     """Save a custom generated map"""
     try:
-        data = request.get_json()
-        map_data = data.get('map')
+        data = request.get_json(silent=True) or {}
+        map_data = data.get('map') if isinstance(data, dict) else None
         
         if not map_data:
             return jsonify({'status': 'error', 'message': 'No map data provided'}), 400
+
+        # Reject oversized or out-of-bounds geometry before any grid is allocated
+        try:
+            check_geometry(map_data, *map_generator.get_max_dimensions())
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
-        # Load existing maps
-        with open('map_data/maps.json', 'r') as f:
-            maps = json.load(f)
-        
-        # Add the new map
-        maps.append(map_data)
+        # Stamp the save time so the map loader can sort by it
+        if 'created_at' not in map_data:
+            map_data['created_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        # Rebuilt from the submitted path, which the editor may have changed
+        map_data['path_table'] = build_path_table(map_data)
+
+        # Score the map against the current towers so listings can sort by difficulty
+        difficulty = map_analysis.difficulty_score(MapGrid.from_json(map_data),
+                                                   content_cache.get(TOWER_DATA_FILE).data)
         
-        # Save back to file
-        with open('map_data/maps.json', 'w') as f:
-            json.dump(maps, f, indent=4)
+        # Append the new map in its own transaction
+        map_store.add(map_data, difficulty_score=difficulty)
         
         return jsonify({
             'status': 'success',
             'message': 'Map saved successfully',
-            'map_id': map_data['id']
+            'map_id': map_data['id'],
+            'difficulty_score': difficulty
         })
         
     except Exception as e:
+        record_exception(e)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -393,71 +1432,33 @@ def get_generator_options():
         'themes': map_generator.get_themes(),
         'difficulties': map_generator.get_difficulties(),
         'complexities': map_generator.get_complexities(),
-        'sizes': ['small', 'medium', 'large']
+        'sizes': map_generator.get_sizes()
     })
 
 @app.route('/api/get-saved-maps', methods=['GET'])
 @login_required
 def get_saved_maps():
-    """Get all saved maps for the map loader"""
+    """
+    Get one page of saved map summaries for the map loader (newest first).
+    Pass the returned next_cursor as ?cursor= to fetch the following page.
+    """
     try:
-        with open('map_data/maps.json', 'r') as f:
-            all_maps = json.load(f)
-        
-        # Filter and format maps for the loader
-        saved_maps = []
-        for i, map_data in enumerate(all_maps):
-            # Ensure all required fields exist with defaults
-            map_id = map_data.get('id', i + 1)
-            map_name = map_data.get('name', f'Map {map_id}')
-            map_theme = map_data.get('theme', 'forest')
-            map_difficulty = map_data.get('difficulty', 'medium')
-            
-            # Handle dimensions - some maps might not have this field
-            if 'dimensions' in map_data:
-                dimensions = map_data['dimensions']
-            else:
-                # Calculate dimensions from path data if available
-                max_x = max_y = 0
-                if 'path' in map_data and map_data['path']:
-                    for point in map_data['path']:
-                        max_x = max(max_x, point.get('x', 0))
-                        max_y = max(max_y, point.get('y', 0))
-                if 'start' in map_data:
-                    max_x = max(max_x, map_data['start'].get('x', 0))
-                    max_y = max(max_y, map_data['start'].get('y', 0))
-                
-                dimensions = {
-                    'width': max_x + 5,  # Add some padding
-                    'height': max_y + 5
-                }
-            
-            # Handle obstacles
-            obstacles = map_data.get('obstacles', [])
-            
-            # Add creation timestamp if not present
-            created_at = map_data.get('created_at', f'2024-01-{str(i+1).zfill(2)}T00:00:00Z')
-            
-            saved_maps.append({
-                'id': str(map_id),  # Ensure ID is string for consistency
-                'name': map_name,
-                'theme': map_theme,
-                'difficulty': map_difficulty,
-                'dimensions': dimensions,
-                'obstacles': obstacles,
-                'created_at': created_at
-            })
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        cursor = request.args.get('cursor')
         
-        # Sort by creation date (newest first)
-        saved_maps.sort(key=lambda x: x['created_at'], reverse=True)
+        try:
+            saved_maps, next_cursor = map_store.list_summaries(limit=limit, cursor=cursor)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         return jsonify({
             'status': 'success',
-            'maps': saved_maps
+            'maps': saved_maps,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
-        print(f"Error in get_saved_maps: {str(e)}")  # Debug logging
+        record_exception(e)
         return jsonify({
             'status': 'error',
             'message': f'Failed to load maps: {str(e)}'
@@ -466,63 +1467,92 @@ def get_saved_maps():
 @app.route('/api/load-map/<map_id>', methods=['GET'])
 @login_required
 def load_map(map_id):
-    """Load a specific map by ID"""
-    try:
-        with open('map_data/maps.json', 'r') as f:
-            all_maps = json.load(f)
-        
-        # Find the map with the specified ID (handle both string and int IDs)
-        target_map = None
-        for map_data in all_maps:
-            # Compare both as strings and as integers to handle mixed ID types
-            current_id = map_data.get('id')
-            if (str(current_id) == str(map_id) or 
-                (isinstance(current_id, int) and current_id == int(map_id)) or
-                (isinstance(current_id, str) and current_id == map_id)):
-                target_map = map_data
-                break
-        
-        if not target_map:
-            return jsonify({
-                'status': 'error',
-                'message': f'Map with ID {map_id} not found'
-            }), 404
+    """Load a specific map by ID (path table only with ?include=path_table)"""
+    fmt, encoding = negotiate_map_format()
+    if fmt is None:
+        return unsupported_format_response()
+    include = requested_map_fields()
+
+    def build(fmt):
+        # IDs are indexed as strings, so int and string IDs both match
+        grid = map_store.get_grid(map_id)
+        if grid is None:
+            raise MapNotFoundError(map_id)
         
         # Ensure the map has all required fields for the editor
-        if 'theme' not in target_map:
-            target_map['theme'] = 'forest'
-        if 'complexity' not in target_map:
-            target_map['complexity'] = 'curved'
-        if 'dimensions' not in target_map:
-            # Calculate dimensions from path data
-            max_x = max_y = 0
-            if 'path' in target_map and target_map['path']:
-                for point in target_map['path']:
-                    max_x = max(max_x, point.get('x', 0))
-                    max_y = max(max_y, point.get('y', 0))
-            if 'start' in target_map:
-                max_x = max(max_x, target_map['start'].get('x', 0))
-                max_y = max(max_y, target_map['start'].get('y', 0))
-            
-            target_map['dimensions'] = {
-                'width': max_x + 5,
-                'height': max_y + 5
-            }
-        
-        return jsonify({
+        grid.meta.setdefault('theme', 'forest')
+        grid.meta.setdefault('complexity', 'curved')
+        grid.has_dimensions = True
+        if fmt == 'binary':
+            return map_wire.pack_maps([grid], include)
+        if fmt == 'compact':
+            target_map = map_wire.compact_map(grid, include)
+        else:
+            target_map = map_wire.without_optional(grid.to_json(), include)
+        return serialize_json({
             'status': 'success',
             'map': target_map
         })
+    
+    try:
+        # Saved maps never change, so encoded bodies are cached per map ID
+        representation = map_representations.get(('map', str(map_id), include), fmt, encoding, build)
+        return representation_response(representation)
         
+    except MapNotFoundError:
+        return jsonify({
+            'status': 'error',
+            'message': f'Map with ID {map_id} not found'
+        }), 404
     except Exception as e:
-        print(f"Error in load_map: {str(e)}")  # Debug logging
+        record_exception(e)
         return jsonify({
             'status': 'error',
             'message': f'Failed to load map: {str(e)}'
         }), 500
 
+@app.route('/api/maps/<map_id>/heatmap', methods=['GET'])
+@login_required
+def map_heatmap(map_id):
+    """Path coverage per cell for one tower type (?tower=, default basic) on a saved map"""
+    tower_id = request.args.get('tower', DEFAULT_TOWER)
+    towers = content_cache.get(TOWER_DATA_FILE)
+    tower = towers.data.get(tower_id)
+    if tower is None:
+        return jsonify({'status': 'error', 'message': f'Unknown tower {tower_id}'}), 404
+    encoding = request.accept_encodings.best_match(map_wire.ENCODINGS)
+
+    def build(fmt):
+        grid = map_store.get_grid(map_id)
+        if grid is None:
+            raise MapNotFoundError(map_id)
+        return serialize_json({
+            'status': 'success',
+            'map_id': map_id,
+            'difficulty_score': map_analysis.difficulty_score(grid, towers.data),
+            **map_analysis.heatmap_payload(grid, tower_id, tower)
+        })
+
+    try:
+        # Maps never change, so heatmaps are cached until the tower data does
+        representation = map_representations.get(('heatmap', str(map_id), tower_id, towers.etag),
+                                                  'json', encoding, build)
+        return representation_response(representation)
+
+    except MapNotFoundError:
+        return jsonify({
+            'status': 'error',
+            'message': f'Map with ID {map_id} not found'
+        }), 404
+    except Exception as e:
+        record_exception(e)
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to compute heatmap: {str(e)}'
+        }), 500
+
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
     app.run(debug=True)
@@ -0,0 +1,150 @@
+"""
+Parallel batch map generation for level designers
+
+    python -m modules.batch_generation --difficulty easy hard --theme forest snow --count 50 > maps.ndjson
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from modules.map_generator import MapGenerator
+
+
+GRID_KEYS = ('difficulty', 'theme', 'size', 'complexity')
+DEFAULT_PARAMS = {'difficulty': 'medium', 'theme': 'forest', 'size': 'medium', 'complexity': 'curved'}
+
+# One generator per worker process, created on first use
+_worker_generator: Optional[MapGenerator] = None
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def expand_grid(grid: Dict, count: int, max_jobs: Optional[int] = None) -> List[Dict]:
+    """
+    Expand {'difficulty': [...], 'theme': [...], ...} into one parameter set per map.
+    Missing keys use the defaults; every combination is generated count times.
+    An integer grid['seed'] makes the batch reproducible: job i uses seed + i.
+    Raises ValueError before building anything if the batch would be empty
+    or hold more than max_jobs maps.
+    """
+    axes = []
+    for key in GRID_KEYS:
+        values = grid.get(key, DEFAULT_PARAMS[key])
+        if isinstance(values, str):
+            values = [values]
+        axes.append(list(values))
+
+    total = math.prod(len(values) for values in axes) * count
+    if total <= 0 or (max_jobs is not None and total > max_jobs):
+        bounds = f'between 1 and {max_jobs} maps' if max_jobs is not None else 'at least 1 map'
+        raise ValueError(f'A batch must contain {bounds}, got {max(total, 0)}')
+
+    jobs = []
+    for combination in itertools.product(*axes):
+        params = dict(zip(GRID_KEYS, combination))
+        jobs.extend(dict(params) for _ in range(count))
+
+    if grid.get('seed') is not None:
+        base_seed = int(grid['seed'])
+        for i, job in enumerate(jobs):
+            job['seed'] = base_seed + i
+    return jobs
+
+
+def validate_params(jobs: List[Dict]):
+    """Raise ValueError for parameters MapGenerator does not know"""
+    generator = MapGenerator()
+    allowed = {
+        'difficulty': generator.get_difficulties(),
+        'theme': list(generator.get_themes().keys()),
+        'size': generator.get_sizes(),
+        'complexity': generator.get_complexities()
+    }
+    for key, values in allowed.items():
+        unknown = sorted({job[key] for job in jobs} - set(values))
+        if unknown:
+            raise ValueError(f'Unknown {key}: {unknown}')
+
+
+def _generate_one(index: int, params: Dict) -> Dict:
+    """Worker entry point: generate one map and time it"""
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = MapGenerator()
+
+    started = time.perf_counter()
+    try:
+        generated_map, stats = _worker_generator.generate_map_with_stats(**params)
+    except Exception as e:
+        return {'index': index, 'status': 'error', 'params': params, 'message': str(e)}
+    elapsed = (time.perf_counter() - started) * 1000
+    return {
+        'index': index,
+        'status': 'success',
+        'params': params,
+        'generation_ms': round(elapsed, 3),
+        'attempts': stats['attempts'],
+        'worker_pid': os.getpid(),
+        'map': generated_map
+    }
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Shared process pool sized to the machine, created lazily"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _executor
+
+
+def generate_batch(jobs: List[Dict], executor: Optional[ProcessPoolExecutor] = None) -> Iterator[Dict]:
+    """Fan jobs out over the process pool and yield results as they complete"""
+    executor = executor or get_executor()
+    futures = [executor.submit(_generate_one, i, params) for i, params in enumerate(jobs)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Drop queued work if the consumer goes away (e.g. client disconnect)
+        for future in futures:
+            future.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate many maps in parallel as NDJSON')
+    parser.add_argument('--difficulty', nargs='+', default=[DEFAULT_PARAMS['difficulty']])
+    parser.add_argument('--theme', nargs='+', default=[DEFAULT_PARAMS['theme']])
+    parser.add_argument('--size', nargs='+', default=[DEFAULT_PARAMS['size']])
+    parser.add_argument('--complexity', nargs='+', default=[DEFAULT_PARAMS['complexity']])
+    parser.add_argument('--count', type=int, default=10, help='maps per parameter combination')
+    parser.add_argument('--seed', type=int, default=None, help='base seed for a reproducible batch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    grid = {key: getattr(args, key) for key in GRID_KEYS}
+    grid['seed'] = args.seed
+    try:
+        jobs = expand_grid(grid, args.count)
+        validate_params(jobs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in generate_batch(jobs, executor):
+            sys.stdout.write(json.dumps(result, separators=(',', ':')) + '\n')
+    elapsed = time.perf_counter() - started
+    print(f'Generated {len(jobs)} maps in {elapsed:.2f}s with {args.workers} workers', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from modules.metrics import phases
+
+
+def serialize_json(data: Any) -> bytes:
+    """Compact JSON encoding used for all cached response bodies"""
+    with phases.time('json'):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+class CachedContent:
+    """
+    Parsed JSON content together with its pre-serialized response body
+    and a strong ETag derived from that body.
+    version identifies the source state, e.g. (mtime_ns, size) for a file.
+    """
+
+    __slots__ = ('path', 'data', 'body', 'etag', 'version', 'derived')
+
+    def __init__(self, path: str, data: Any, body: bytes, version: Tuple):
+        self.path = path
+        self.data = data
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()
+        self.version = version
+        self.derived = {}
+
+
+class ContentCache:
+    """
+    In-process cache for game data files (towers, enemies, maps, ...)
+    Entries are revalidated against the file's mtime and size on every access,
+    so edits on disk are picked up without a restart.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, CachedContent] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> CachedContent:
+        """Return the cached entry for path, reloading it if the file changed"""
+        with phases.time('file_io'):
+            stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and self._is_fresh(entry, stat):
+            return entry
+
+        with self._lock:
+            # Another thread may have reloaded the file while we waited
+            entry = self._entries.get(path)
+            if entry is not None and self._is_fresh(entry, stat):
+                return entry
+
+            with phases.time('file_io'), open(path, 'rb') as f:
+                raw = f.read()
+            with phases.time('json'):
+                data = json.loads(raw)
+            body = serialize_json(data)
+
+            entry = CachedContent(path, data, body, (stat.st_mtime_ns, stat.st_size))
+            self._entries[path] = entry
+            return entry
+
+    def derive(self, path: str, name: str, factory: Callable[[Any], Any]) -> Any:
+        """
+        Return factory(data) for the current version of path.
+        The result is computed once per file version and dropped on reload.
+        """
+        entry = self.get(path)
+        try:
+            return entry.derived[name]
+        except KeyError:
+            value = factory(entry.data)
+            entry.derived[name] = value
+            return value
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drop one entry, or every entry if no path is given"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    @staticmethod
+    def _is_fresh(entry: CachedContent, stat: os.stat_result) -> bool:
+        return entry.version == (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,279 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional, Tuple
+
+
+# Keys pack (score descending, user id ascending) into one uint64 so the
+# natural ascending order of keys is the leaderboard order
+_SCORE_OFFSET = 2 ** 31 - 1
+_ID_BITS = 32
+# Scores that fit in a key (the int32 range)
+MIN_SCORE = -2 ** 31
+MAX_SCORE = 2 ** 31 - 1
+
+
+def encode_key(score: int, user_id: int) -> int:
+    """Raises ValueError for scores or user ids that do not fit in a key"""
+    if isinstance(score, bool) or not isinstance(score, int) or not MIN_SCORE <= score <= MAX_SCORE:
+        raise ValueError(f'Score must be an integer between {MIN_SCORE} and {MAX_SCORE}: {score!r}')
+    if isinstance(user_id, bool) or not isinstance(user_id, int) or not 0 <= user_id < 1 << _ID_BITS:
+        raise ValueError(f'Invalid user id: {user_id!r}')
+    return ((_SCORE_OFFSET - score) << _ID_BITS) | user_id
+
+
+def decode_key(key: int) -> Tuple[int, int]:
+    """Inverse of encode_key, returning (score, user_id)"""
+    return _SCORE_OFFSET - (key >> _ID_BITS), key & ((1 << _ID_BITS) - 1)
+
+
+class RankIndex:
+    """
+    Sorted set of uint64 keys with O(log n) rank and positional lookups
+    Keys live in sorted array('Q') blocks of about `load` items; a Fenwick
+    tree over the block sizes turns "how many keys come before this block"
+    into a logarithmic prefix sum.
+    """
+
+    __slots__ = ('load', '_blocks', '_maxes', '_tree', '_len')
+
+    def __init__(self, keys: Iterable[int] = (), load: int = 1024):
+        self.load = load
+        keys = sorted(keys)
+        self._blocks = [array('Q', keys[i:i + load]) for i in range(0, len(keys), load)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(keys)
+        self._rebuild_tree()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _rebuild_tree(self):
+        n = len(self._blocks)
+        tree = [0] * (n + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block_index: int, delta: int):
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block_index: int) -> int:
+        """Number of keys in blocks[:block_index]"""
+        tree = self._tree
+        total = 0
+        i = block_index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """(block, offset) of the key at position index"""
+        tree = self._tree
+        n = len(self._blocks)
+        pos = 0
+        step = 1 << n.bit_length()
+        while step:
+            if pos + step <= n and tree[pos + step] <= index:
+                pos += step
+                index -= tree[pos]
+            step >>= 1
+        return pos, index
+
+    def add(self, key: int):
+        if not self._blocks:
+            self._blocks.append(array('Q', [key]))
+            self._maxes.append(key)
+            self._len = 1
+            self._rebuild_tree()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+        block = self._blocks[i]
+        insort(block, key)
+        self._maxes[i] = block[-1]
+        self._len += 1
+        if len(block) > 2 * self.load:
+            self._blocks[i:i + 1] = [block[:self.load], block[self.load:]]
+            self._maxes[i:i + 1] = [block[self.load - 1], block[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, key: int):
+        """Remove key, raising KeyError if it is not present"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            raise KeyError(key)
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            raise KeyError(key)
+        del block[j]
+        self._len -= 1
+        if not block:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+        else:
+            self._maxes[i] = block[-1]
+            self._tree_add(i, -1)
+
+    def rank(self, key: int) -> int:
+        """Number of keys smaller than key (the 0-based position of key)"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._prefix(i) + bisect_left(self._blocks[i], key)
+
+    def slice(self, start: int, stop: int) -> List[int]:
+        """Keys at positions [start, stop)"""
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        block_index, offset = self._locate(start)
+        keys = []
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self._blocks[block_index][offset:offset + remaining]
+            keys.extend(chunk)
+            remaining -= len(chunk)
+            block_index += 1
+            offset = 0
+        return keys
+
+
+class Leaderboard:
+    """
+    In-memory ranking of all users, globally and per selected map
+    Scores and map codes are kept in flat arrays indexed by user id, keys in
+    one RankIndex per board. Updates, rank queries and page lookups are all
+    O(log n); load() rebuilds everything from the database rows.
+    """
+
+    def __init__(self, load: int = 1024):
+        self._block_load = load
+        self._lock = threading.RLock()
+        self._global = RankIndex(load=load)
+        self._boards = {}                 # map code -> RankIndex
+        self._scores = array('q')         # by user id
+        self._map_codes = array('H')      # by user id, 0 = not ranked
+        self._map_names = [None]          # map code -> map id
+        self._map_index = {}              # map id -> map code
+        self._replay = None               # updates made while load() runs
+
+    def __len__(self) -> int:
+        return len(self._global)
+
+    def _map_code(self, map_id: str) -> int:
+        code = self._map_index.get(map_id)
+        if code is None:
+            code = len(self._map_names)
+            self._map_names.append(map_id)
+            self._map_index[map_id] = code
+        return code
+
+    def _ensure_capacity(self, user_id: int):
+        missing = user_id + 1 - len(self._scores)
+        if missing > 0:
+            self._scores.extend([0] * missing)
+            self._map_codes.extend([0] * missing)
+
+    def load(self, rows: Iterable[Tuple[int, int, str]]):
+        """
+        Replace the whole leaderboard with (user_id, score, map_id) rows.
+        The new boards are built without holding the lock; updates that
+        arrive meanwhile are replayed on top before the swap completes.
+        Rows whose score or id does not fit in a key are left unranked.
+        """
+        with self._lock:
+            self._replay = []
+        try:
+            fresh = Leaderboard(load=self._block_load)
+            global_keys = []
+            board_keys = {}
+            for user_id, score, map_id in rows:
+                try:
+                    key = encode_key(score, user_id)
+                except ValueError:
+                    continue
+                fresh._ensure_capacity(user_id)
+                code = fresh._map_code(map_id)
+                fresh._scores[user_id] = score
+                fresh._map_codes[user_id] = code
+                global_keys.append(key)
+                board_keys.setdefault(code, []).append(key)
+            fresh._global = RankIndex(global_keys, load=self._block_load)
+            fresh._boards = {code: RankIndex(keys, load=self._block_load)
+                             for code, keys in board_keys.items()}
+
+            with self._lock:
+                for args in self._replay:
+                    fresh.update(*args)
+                self._global = fresh._global
+                self._boards = fresh._boards
+                self._scores = fresh._scores
+                self._map_codes = fresh._map_codes
+                self._map_names = fresh._map_names
+                self._map_index = fresh._map_index
+        finally:
+            with self._lock:
+                self._replay = None
+
+    def update(self, user_id: int, score: int, map_id: str):
+        """Insert or move a user after a score or map change (ValueError if it does not fit)"""
+        key = encode_key(score, user_id)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((user_id, score, map_id))
+            self._ensure_capacity(user_id)
+            old_code = self._map_codes[user_id]
+            code = self._map_code(map_id)
+            if old_code:
+                old_score = self._scores[user_id]
+                if old_score == score and old_code == code:
+                    return
+                old_key = encode_key(old_score, user_id)
+                self._global.remove(old_key)
+                self._boards[old_code].remove(old_key)
+            self._scores[user_id] = score
+            self._map_codes[user_id] = code
+            self._global.add(key)
+            self._boards.setdefault(code, RankIndex(load=self._block_load)).add(key)
+
+    def _board(self, map_id: Optional[str]) -> Optional[RankIndex]:
+        if map_id is None:
+            return self._global
+        code = self._map_index.get(map_id)
+        return self._boards.get(code) if code else None
+
+    def rank(self, user_id: int, map_id: Optional[str] = None) -> Optional[int]:
+        """1-based rank of user_id on the global or a map board, None if unranked"""
+        with self._lock:
+            if user_id >= len(self._scores) or not self._map_codes[user_id]:
+                return None
+            if map_id is not None and self._map_names[self._map_codes[user_id]] != map_id:
+                return None
+            board = self._board(map_id)
+            return board.rank(encode_key(self._scores[user_id], user_id)) + 1
+
+    def page(self, offset: int, limit: int, map_id: Optional[str] = None) -> Tuple[List[Tuple[int, int, int]], int]:
+        """Return ([(rank, user_id, score), ...], total) for one page of a board"""
+        with self._lock:
+            board = self._board(map_id)
+            if board is None:
+                return [], 0
+            entries = []
+            for position, key in enumerate(board.slice(offset, offset + limit), offset + 1):
+                score, user_id = decode_key(key)
+                entries.append((position, user_id, score))
+            return entries, len(board)
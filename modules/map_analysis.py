@@ -0,0 +1,161 @@
+"""
+Tower placement analysis: path coverage heatmaps and difficulty scores
+
+    python -m modules.map_analysis --db map_data/maps.db [--all] [--chunk 1000]
+
+scores every stored map that has no difficulty score yet (or all with --all).
+"""
+import argparse
+import json
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from modules.map_grid import BUILDABLE, MapGrid
+from modules.map_store import MapStore
+from modules.simulator.engine import GRID_SIZE
+
+
+# Towers assumed placed when scoring a map
+DIFFICULTY_TOWERS = 10
+NOT_BUILDABLE = -1
+
+
+def disc_spans(range_px: float) -> List[tuple]:
+    """(dy, half_width) rows of the disc of cells whose centres lie within range_px"""
+    radius = range_px / GRID_SIZE
+    reach = int(np.floor(radius))
+    return [(dy, int(np.floor(np.sqrt(radius * radius - dy * dy)))) for dy in range(-reach, reach + 1)]
+
+
+def disc_kernel(range_px: float) -> np.ndarray:
+    """The disc as a boolean (2r+1, 2r+1) kernel"""
+    spans = disc_spans(range_px)
+    reach = len(spans) // 2
+    kernel = np.zeros((2 * reach + 1, 2 * reach + 1), dtype=bool)
+    for dy, half in spans:
+        kernel[dy + reach, reach - half:reach + half + 1] = True
+    return kernel
+
+
+def convolve_disc(masks: np.ndarray, range_px: float) -> np.ndarray:
+    """
+    Convolve boolean masks of shape (..., H, W) with the disc kernel of range_px.
+    The disc is a stack of horizontal spans, so each output cell is a sum of
+    2r+1 span sums taken from row prefix sums: O(r * H * W) instead of
+    O(r^2 * H * W), and any leading batch axes are processed at once.
+    """
+    spans = disc_spans(range_px)
+    reach = max((half for _, half in spans), default=0)
+    reach_y = len(spans) // 2
+    height, width = masks.shape[-2:]
+    pad = [(0, 0)] * (masks.ndim - 2) + [(reach_y, reach_y), (reach + 1, reach)]
+    padded = np.pad(masks.astype(np.int32), pad)
+    prefix = np.cumsum(padded, axis=-1)
+
+    out = np.zeros(masks.shape, dtype=np.int32)
+    for dy, half in spans:
+        rows = prefix[..., reach_y + dy:reach_y + dy + height, :]
+        # Columns x - half .. x + half of the unpadded mask
+        out += rows[..., reach + 1 + half:reach + 1 + half + width] - rows[..., reach - half:reach - half + width]
+    return out
+
+
+def coverage_heatmap(grid: MapGrid, range_px: float) -> np.ndarray:
+    """Path cells within range of a tower on each cell, NOT_BUILDABLE where none can stand"""
+    coverage = convolve_disc(grid.path_mask(), range_px)
+    coverage[grid.cells != BUILDABLE] = NOT_BUILDABLE
+    return coverage
+
+
+def _coverage_ratio(heatmaps: np.ndarray, range_px: float, towers: int) -> np.ndarray:
+    """
+    Mean coverage of the best `towers` cells per map, relative to a straight
+    path through the middle of the disc (missing cells count as zero)
+    """
+    flat = heatmaps.reshape(heatmaps.shape[0], -1)
+    take = min(towers, flat.shape[1])
+    best = np.maximum(-np.partition(-flat, take - 1, axis=1)[:, :take], 0)
+    straight = 2 * (len(disc_spans(range_px)) // 2) + 1
+    return np.minimum(best.sum(axis=1) / (towers * straight), 1.0)
+
+
+def difficulty_scores(grids: List[MapGrid], tower_types: Dict,
+                      towers: int = DIFFICULTY_TOWERS) -> List[float]:
+    """
+    Difficulty in [0, 1] per map: 1 minus how much path the best `towers`
+    cells can cover, averaged over all tower types. 0 means every one of
+    them sees at least a full diameter of path, 1 that no cell sees any.
+    Maps of the same size are stacked and scored in one convolution.
+    """
+    scores = [1.0] * len(grids)
+    by_shape: Dict[tuple, List[int]] = {}
+    for i, grid in enumerate(grids):
+        by_shape.setdefault((grid.height, grid.width), []).append(i)
+
+    for indices in by_shape.values():
+        paths = np.stack([grids[i].path_mask() for i in indices])
+        buildable = np.stack([grids[i].cells == BUILDABLE for i in indices])
+        ratios = np.zeros(len(indices))
+        for tower in tower_types.values():
+            heatmaps = convolve_disc(paths, tower['range'])
+            heatmaps[~buildable] = NOT_BUILDABLE
+            ratios += _coverage_ratio(heatmaps, tower['range'], towers)
+        ratios /= max(len(tower_types), 1)
+        for i, ratio in zip(indices, ratios):
+            scores[i] = round(float(1.0 - ratio), 4)
+    return scores
+
+
+def difficulty_score(grid: MapGrid, tower_types: Dict) -> float:
+    return difficulty_scores([grid], tower_types)[0]
+
+
+def heatmap_payload(grid: MapGrid, tower_id: str, tower: Dict, best: int = DIFFICULTY_TOWERS) -> Dict:
+    """JSON-ready heatmap of one tower type on one map, with its best cells"""
+    heatmap = coverage_heatmap(grid, tower['range'])
+    order = np.argsort(-heatmap, axis=None, kind='stable')[:best]
+    return {
+        'tower': tower_id,
+        'range': tower['range'],
+        'radius_cells': tower['range'] / GRID_SIZE,
+        'width': grid.width,
+        'height': grid.height,
+        'path_cells': int(np.count_nonzero(grid.path_mask())),
+        'max_coverage': int(heatmap.max(initial=0)),
+        # Row-major, heatmap[y][x]; -1 marks cells where no tower can be built
+        'heatmap': heatmap.tolist(),
+        'best_cells': [{'x': int(i % grid.width), 'y': int(i // grid.width), 'coverage': int(heatmap.flat[i])}
+                       for i in order if heatmap.flat[i] > 0]
+    }
+
+
+def score_store(store: MapStore, tower_types: Dict, rescore_all: bool = False, chunk: int = 1000) -> int:
+    """Score the maps of a MapStore chunk by chunk; returns the number scored"""
+    scored = 0
+    for rows in store.iter_grids(missing_difficulty_only=not rescore_all, chunk=chunk):
+        seqs = [seq for seq, _ in rows]
+        scores = difficulty_scores([grid for _, grid in rows], tower_types)
+        store.set_difficulty_scores(zip(seqs, scores))
+        scored += len(rows)
+    return scored
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description='Compute difficulty scores for stored maps')
+    parser.add_argument('--db', default='map_data/maps.db')
+    parser.add_argument('--towers', default='tower_data/tower_data.json')
+    parser.add_argument('--all', action='store_true', help='rescore maps that already have a score')
+    parser.add_argument('--chunk', type=int, default=1000, help='maps loaded and scored at once')
+    args = parser.parse_args(argv)
+
+    with open(args.towers) as f:
+        tower_types = json.load(f)
+    started = time.perf_counter()
+    scored = score_store(MapStore(args.db), tower_types, rescore_all=args.all, chunk=args.chunk)
+    print(f'Scored {scored} maps in {time.perf_counter() - started:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,79 @@
 import random
 import json
+import copy
+import time
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 import math
 
+import numpy as np
+
+from modules.map_grid import MapGrid, path_buffer
+from modules.path_table import build_path_table
+
+NOISE_BANK_SIZE = 8
+NOISE_BANK_SEED = 1337
+NOISE_FEATURE_SIZE = 6  # cells between noise lattice points
+
+
+@lru_cache(maxsize=16)
+def _noise_bank(width: int, height: int) -> np.ndarray:
+    """
+    Tileable value-noise fields in [0, 1] for one map size, computed once.
+    Tileable so that np.roll offsets give new fields without seams.
+    """
+    gen = np.random.default_rng(NOISE_BANK_SEED)
+    lattice_w = max(2, width // NOISE_FEATURE_SIZE)
+    lattice_h = max(2, height // NOISE_FEATURE_SIZE)
+    
+    u = np.arange(width) * lattice_w / width
+    v = np.arange(height) * lattice_h / height
+    x0 = np.floor(u).astype(int)
+    y0 = np.floor(v).astype(int)
+    fx = u - x0
+    fy = v - y0
+    fx = fx * fx * (3 - 2 * fx)  # smoothstep
+    fy = fy * fy * (3 - 2 * fy)
+    x1 = (x0 + 1) % lattice_w
+    y1 = (y0 + 1) % lattice_h
+    
+    fields = []
+    for _ in range(NOISE_BANK_SIZE):
+        lattice = gen.random((lattice_h, lattice_w))
+        top = lattice[y0][:, x0] * (1 - fx) + lattice[y0][:, x1] * fx
+        bottom = lattice[y1][:, x0] * (1 - fx) + lattice[y1][:, x1] * fx
+        field = top * (1 - fy)[:, None] + bottom * fy[:, None]
+        field -= field.min()
+        field /= max(field.max(), 1e-9)
+        fields.append(field)
+    return np.stack(fields)
+
+
+class MapGenerationError(Exception):
+    """Raised when no valid map was found within the attempt budget"""
+
+
 class MapGenerator:
     """
     Advanced Map Generator for Tower Defense Game
     Supports procedural generation with themes, difficulty scaling, and validation
     """
     
-    def __init__(self):
+    # Bumped whenever the output for a given seed changes; older versions stay
+    # reproducible so maps stored as parameters plus seed keep expanding the same
+    GENERATOR_VERSION = 3
+    SUPPORTED_VERSIONS = (1, 2, 3)
+    
+    def __init__(self, cache_size: int = 512, max_attempts: int = 10,
+                 min_buildable_ratio: float = 0.5):
+        self.max_attempts = max_attempts
+        self.min_buildable_ratio = min_buildable_ratio
         self.themes = {
             'forest': {
                 'name': 'Forest',
                 'obstacles': ['tree', 'bush', 'water', 'rock'],
                 'colors': {'path': '#8B7355', 'bg': '#6b8e6b'},
+                'layout': 'clustered',
                 'sprites': {
                     'tree': 'tree_1', 'bush': 'bush_1', 
                     'water': 'water_1', 'rock': 'rock_1'
@@ -24,6 +83,7 @@ class MapGenerator:
                 'name': 'Desert',
                 'obstacles': ['cactus', 'rock', 'oasis', 'dune'],
                 'colors': {'path': '#D2B48C', 'bg': '#F4A460'},
+                'layout': 'scattered',
                 'sprites': {
                     'cactus': 'cactus_1', 'rock': 'desert_rock_1',
                     'oasis': 'oasis_1', 'dune': 'dune_1'
@@ -33,6 +93,7 @@ class MapGenerator:
                 'name': 'Snow',
                 'obstacles': ['ice', 'snowman', 'frozen_tree', 'ice_rock'],
                 'colors': {'path': '#B0C4DE', 'bg': '#F0F8FF'},
+                'layout': 'clustered',
                 'sprites': {
                     'ice': 'ice_1', 'snowman': 'snowman_1',
                     'frozen_tree': 'frozen_tree_1', 'ice_rock': 'ice_rock_1'
@@ -42,6 +103,7 @@ class MapGenerator:
                 'name': 'Lava',
                 'obstacles': ['volcano_rock', 'lava_pool', 'obsidian', 'fire_crystal'],
                 'colors': {'path': '#8B0000', 'bg': '#FF4500'},
+                'layout': 'clustered',
                 'sprites': {
                     'volcano_rock': 'volcano_rock_1', 'lava_pool': 'lava_pool_1',
                     'obsidian': 'obsidian_1', 'fire_crystal': 'fire_crystal_1'
@@ -49,6 +111,15 @@ class MapGenerator:
             }
         }
         
+        # Map dimensions based on size
+        self.size_settings = {
+            'small': (25, 20),
+            'medium': (32, 24), 
+            'large': (40, 30),
+            'xlarge': (64, 48),
+            'huge': (128, 96)
+        }
+        
         self.difficulty_settings = {
             'easy': {'path_length': 8, 'turns': 2, 'obstacles': 3},
             'medium': {'path_length': 12, 'turns': 4, 'obstacles': 6},
@@ -62,39 +133,120 @@ class MapGenerator:
             'maze': self._generate_maze_path,
             'spiral': self._generate_spiral_path
         }
+        
+        # LRU cache of maps keyed by (difficulty, theme, size, complexity, seed, version)
+        self._generate_cached = lru_cache(maxsize=cache_size)(self._generate_seeded)
     
     def generate_map(self, difficulty: str = 'medium', theme: str = 'forest', 
                     size: str = 'medium', complexity: str = 'curved', 
-                    custom_name: str = None) -> Dict:
+                    custom_name: str = None, seed: Optional[int] = None,
+                    version: Optional[int] = None) -> Dict:
         """
         Generate a complete map with specified parameters
+        The same parameters, seed and version always yield the same map. Without
+        a seed a fresh one is drawn; it is recorded in the map's generation_params.
         """
-        # Map dimensions based on size
-        size_settings = {
-            'small': (25, 20),
-            'medium': (32, 24), 
-            'large': (40, 30)
+        map_data, _ = self.generate_map_with_stats(difficulty, theme, size, complexity,
+                                                   custom_name, seed, version)
+        return map_data
+    
+    def generate_map_with_stats(self, difficulty: str = 'medium', theme: str = 'forest',
+                                size: str = 'medium', complexity: str = 'curved',
+                                custom_name: str = None, seed: Optional[int] = None,
+                                version: Optional[int] = None) -> Tuple[Dict, Dict]:
+        """Like generate_map, but also return per-attempt generation stats"""
+        version = self.GENERATOR_VERSION if version is None else version
+        if version not in self.SUPPORTED_VERSIONS:
+            raise ValueError(f'Unsupported generator version: {version}')
+        
+        if seed is None:
+            map_data, stats = self._generate_seeded(difficulty, theme, size, complexity,
+                                                    random.getrandbits(32), version)
+        else:
+            map_data, stats = self._generate_cached(difficulty, theme, size, complexity,
+                                                    seed, version)
+            map_data = copy.deepcopy(map_data)
+        
+        if custom_name:
+            map_data['name'] = custom_name
+        return map_data, dict(stats)
+    
+    def _generate_seeded(self, difficulty: str, theme: str, size: str,
+                         complexity: str, seed: int, version: int) -> Tuple[Dict, Dict]:
+        """Generate a map from its own random.Random(seed) stream"""
+        rng = random.Random(seed)
+        map_data, stats = self._build_map(difficulty, theme, size, complexity, rng, version)
+        map_data['generation_params'] = {
+            'difficulty': difficulty,
+            'theme': theme,
+            'size': size,
+            'complexity': complexity,
+            'seed': seed,
+            'version': version
         }
+        # Served with the map so enemies are positioned by distance travelled
+        map_data['path_table'] = build_path_table(map_data)
+        return map_data, stats
+    
+    def _build_map(self, difficulty: str, theme: str, size: str,
+                   complexity: str, rng: random.Random, version: int) -> Tuple[Dict, Dict]:
+        """
+        Retry loop around _build_attempt, bounded by self.max_attempts
+        The first attempt uses the requested complexity, later ones fall back to 'linear'.
+        """
+        stats = {'attempts': 0, 'attempt_ms': []}
+        attempt_complexity = complexity
+        for _ in range(self.max_attempts):
+            started = time.perf_counter()
+            map_data = self._build_attempt(difficulty, theme, size, attempt_complexity, rng, version)
+            if version == 1:
+                valid, info = self._validate_map(map_data), {}
+            else:
+                valid, info = self._validate_grid(map_data)
+            stats['attempts'] += 1
+            stats['attempt_ms'].append(round((time.perf_counter() - started) * 1000, 3))
+            
+            if valid:
+                stats.update(info)
+                stats['total_ms'] = round(sum(stats['attempt_ms']), 3)
+                return map_data, stats
+            # If validation fails, try again with simpler settings
+            attempt_complexity = 'linear'
         
-        width, height = size_settings.get(size, (32, 24))
+        raise MapGenerationError(
+            f'No valid map after {self.max_attempts} attempts '
+            f'({difficulty}, {theme}, {size}, {complexity})'
+        )
+    
+    def _build_attempt(self, difficulty: str, theme: str, size: str,
+                       complexity: str, rng: random.Random, version: int) -> Dict:
+        """Build one candidate map, drawing all randomness from rng"""
+        width, height = self.size_settings.get(size, (32, 24))
         settings = self.difficulty_settings[difficulty]
         theme_data = self.themes[theme]
         
-        # Generate unique map ID
-        map_id = self._generate_map_id()
+        # Generate map ID
+        map_id = self._generate_map_id(rng)
         
         # Generate path using selected complexity
         path_generator = self.complexity_patterns[complexity]
-        start, path = path_generator(width, height, settings)
+        start, path = path_generator(width, height, settings, rng)
         
         # Generate obstacles
-        obstacles = self._generate_obstacles(width, height, start, path, 
-                                           settings['obstacles'], theme_data)
+        if version < 3:
+            obstacles = self._generate_obstacles(width, height, start, path, 
+                                               settings['obstacles'], theme_data, rng)
+        else:
+            # Scale the obstacle count with map area (medium is the reference size)
+            num_obstacles = max(settings['obstacles'],
+                                round(settings['obstacles'] * width * height / (32 * 24)))
+            obstacles = self._sample_obstacles(width, height, start, path,
+                                               num_obstacles, theme_data, rng)
         
         # Create map data structure
-        map_data = {
+        return {
             'id': map_id,
-            'name': custom_name or f"{theme_data['name']} {complexity.title()} ({difficulty.title()})",
+            'name': f"{theme_data['name']} {complexity.title()} ({difficulty.title()})",
             'start': start,
             'path': path,
             'obstacles': obstacles,
@@ -106,15 +258,43 @@ class MapGenerator:
             'generated': True,
             'colors': theme_data['colors']
         }
-        
-        # Validate the map
-        if self._validate_map(map_data):
-            return map_data
-        else:
-            # If validation fails, try again with simpler settings
-            return self.generate_map(difficulty, theme, size, 'linear', custom_name)
     
-    def _generate_linear_path(self, width: int, height: int, settings: Dict) -> Tuple[Dict, List[Dict]]:
+    def to_seed_record(self, map_data: Dict) -> Optional[Dict]:
+        """
+        Return a compact {generation_params, id, name, created_at} record if
+        map_data is an unmodified generated map, otherwise None
+        """
+        params = map_data.get('generation_params')
+        if not params:
+            return None
+        try:
+            expanded = self.generate_map(custom_name=map_data.get('name'), **params)
+        except (KeyError, TypeError, ValueError):
+            return None
+        
+        submitted = {k: v for k, v in map_data.items() if k != 'created_at'}
+        if expanded != submitted:
+            return None
+        
+        record = {
+            'seed_only': True,
+            'id': map_data['id'],
+            'name': map_data['name'],
+            'generation_params': params
+        }
+        if 'created_at' in map_data:
+            record['created_at'] = map_data['created_at']
+        return record
+    
+    def from_seed_record(self, record: Dict) -> Dict:
+        """Expand a record produced by to_seed_record back into the full map"""
+        map_data = self.generate_map(custom_name=record.get('name'), **record['generation_params'])
+        if 'created_at' in record:
+            map_data['created_at'] = record['created_at']
+        return map_data
+    
+    def _generate_linear_path(self, width: int, height: int, settings: Dict,
+                              rng: random.Random) -> Tuple[Dict, List[Dict]]:
         """Generate a simple linear path with some variation"""
         start_y = height // 2
         start = {'x': 0, 'y': start_y}
@@ -127,8 +307,8 @@ class MapGenerator:
         
         for i in range(target_length):
             # Add some vertical variation
-            if i > 0 and i < target_length - 1 and random.random() < 0.3:
-                variation = random.choice([-1, 1])
+            if i > 0 and i < target_length - 1 and rng.random() < 0.3:
+                variation = rng.choice([-1, 1])
                 new_y = max(1, min(height - 2, current_y + variation))
                 if new_y != current_y:
                     path.append({'x': current_x, 'y': new_y})
@@ -143,31 +323,32 @@ class MapGenerator:
         
         return start, path
     
-    def _generate_curved_path(self, width: int, height: int, settings: Dict) -> Tuple[Dict, List[Dict]]:
+    def _generate_curved_path(self, width: int, height: int, settings: Dict,
+                              rng: random.Random) -> Tuple[Dict, List[Dict]]:
         """Generate a curved path with smooth turns"""
-        start_side = random.choice(['left', 'top', 'bottom'])
+        start_side = rng.choice(['left', 'top', 'bottom'])
         
         if start_side == 'left':
-            start = {'x': 0, 'y': random.randint(3, height - 4)}
+            start = {'x': 0, 'y': rng.randint(3, height - 4)}
         elif start_side == 'top':
-            start = {'x': random.randint(3, width - 4), 'y': 0}
+            start = {'x': rng.randint(3, width - 4), 'y': 0}
         else:  # bottom
-            start = {'x': random.randint(3, width - 4), 'y': height - 1}
+            start = {'x': rng.randint(3, width - 4), 'y': height - 1}
         
         path = []
         current_x, current_y = start['x'], start['y']
         
         # Target end point
         if start_side == 'left':
-            target_x, target_y = width - 1, random.randint(3, height - 4)
+            target_x, target_y = width - 1, rng.randint(3, height - 4)
         elif start_side == 'top':
-            target_x, target_y = random.randint(3, width - 4), height - 1
+            target_x, target_y = rng.randint(3, width - 4), height - 1
         else:
-            target_x, target_y = random.randint(3, width - 4), 0
+            target_x, target_y = rng.randint(3, width - 4), 0
         
         # Generate curved path using waypoints
         waypoints = self._generate_waypoints(current_x, current_y, target_x, target_y, 
-                                            settings['turns'], width, height)
+                                            settings['turns'], width, height, rng)
         
         for waypoint in waypoints:
             # Create smooth path to waypoint
@@ -177,7 +358,8 @@ class MapGenerator:
         
         return start, path
     
-    def _generate_maze_path(self, width: int, height: int, settings: Dict) -> Tuple[Dict, List[Dict]]:
+    def _generate_maze_path(self, width: int, height: int, settings: Dict,
+                            rng: random.Random) -> Tuple[Dict, List[Dict]]:
         """Generate a maze-like path with multiple turns"""
         start = {'x': 0, 'y': height // 2}
         path = []
@@ -187,7 +369,7 @@ class MapGenerator:
         
         while current_x < width - 3:
             # Move in current direction
-            steps = random.randint(2, 4)
+            steps = rng.randint(2, 4)
             
             for _ in range(steps):
                 if direction == 'right':
@@ -209,13 +391,14 @@ class MapGenerator:
             # Change direction randomly
             if current_x < width - 3:
                 if direction == 'right':
-                    direction = random.choice(['up', 'down'])
+                    direction = rng.choice(['up', 'down'])
                 else:
                     direction = 'right'
         
         return start, path
     
-    def _generate_spiral_path(self, width: int, height: int, settings: Dict) -> Tuple[Dict, List[Dict]]:
+    def _generate_spiral_path(self, width: int, height: int, settings: Dict,
+                              rng: random.Random) -> Tuple[Dict, List[Dict]]:
         """Generate a spiral-like path"""
         center_x, center_y = width // 2, height // 2
         start = {'x': 0, 'y': center_y}
@@ -252,7 +435,8 @@ class MapGenerator:
         return start, path
     
     def _generate_waypoints(self, start_x: int, start_y: int, end_x: int, end_y: int, 
-                           num_turns: int, width: int, height: int) -> List[Dict]:
+                           num_turns: int, width: int, height: int,
+                           rng: random.Random) -> List[Dict]:
         """Generate waypoints for curved paths"""
         waypoints = []
         
@@ -264,8 +448,8 @@ class MapGenerator:
             base_y = int(start_y + (end_y - start_y) * progress)
             
             # Add random offset
-            offset_x = random.randint(-3, 3)
-            offset_y = random.randint(-3, 3)
+            offset_x = rng.randint(-3, 3)
+            offset_y = rng.randint(-3, 3)
             
             waypoint_x = max(2, min(width - 3, base_x + offset_x))
             waypoint_y = max(2, min(height - 3, base_y + offset_y))
@@ -298,29 +482,31 @@ class MapGenerator:
         return path
     
     def _generate_obstacles(self, width: int, height: int, start: Dict, 
-                           path: List[Dict], num_obstacles: int, theme_data: Dict) -> List[Dict]:
+                           path: List[Dict], num_obstacles: int, theme_data: Dict,
+                           rng: random.Random) -> List[Dict]:
         """Generate obstacles that don't block the path"""
         obstacles = []
-        path_positions = {(start['x'], start['y'])}
-        
-        # Add all path positions to blocked set
+        # Blocked cells as a flat occupancy buffer: the path plus its 3x3 neighbourhood
+        blocked = bytearray(width * height)
+        if 0 <= start['x'] < width and 0 <= start['y'] < height:
+            blocked[start['y'] * width + start['x']] = 1
         for point in path:
-            path_positions.add((point['x'], point['y']))
-            # Also block adjacent positions to path
             for dx in [-1, 0, 1]:
                 for dy in [-1, 0, 1]:
-                    path_positions.add((point['x'] + dx, point['y'] + dy))
+                    x, y = point['x'] + dx, point['y'] + dy
+                    if 0 <= x < width and 0 <= y < height:
+                        blocked[y * width + x] = 1
         
         obstacle_types = theme_data['obstacles']
         sprites = theme_data['sprites']
         
         attempts = 0
         while len(obstacles) < num_obstacles and attempts < num_obstacles * 3:
-            x = random.randint(1, width - 2)
-            y = random.randint(1, height - 2)
+            x = rng.randint(1, width - 2)
+            y = rng.randint(1, height - 2)
             
-            if (x, y) not in path_positions:
-                obstacle_type = random.choice(obstacle_types)
+            if not blocked[y * width + x]:
+                obstacle_type = rng.choice(obstacle_types)
                 obstacles.append({
                     'x': x,
                     'y': y,
@@ -330,14 +516,72 @@ class MapGenerator:
                     }
                 })
                 # Block this position for future obstacles
-                path_positions.add((x, y))
+                blocked[y * width + x] = 1
             
             attempts += 1
         
         return obstacles
     
+    def _sample_obstacles(self, width: int, height: int, start: Dict,
+                          path: List[Dict], num_obstacles: int, theme_data: Dict,
+                          rng: random.Random) -> List[Dict]:
+        """
+        Place obstacles by sampling free cells without replacement (generator version 3+)
+        Free cells are computed once as a mask, so the requested count is always
+        met when enough free cells exist. 'clustered' themes weight the draw by a
+        noise field and pick obstacle types from a second one, forming groves and lakes.
+        """
+        gen = np.random.default_rng(rng.getrandbits(64))
+        
+        # Path cells and their 3x3 neighbourhood are blocked, as is the border
+        grid = MapGrid(width, height, (start['x'], start['y']), path_buffer(path))
+        near_path = grid.near_path_mask()
+        
+        free = np.zeros((height, width), dtype=bool)
+        free[1:height - 1, 1:width - 1] = True
+        free &= ~near_path
+        free_cells = np.flatnonzero(free)
+        
+        count = min(num_obstacles, free_cells.size)
+        if count == 0:
+            return []
+        
+        if theme_data.get('layout') == 'clustered':
+            # Weighted sampling without replacement (Efraimidis-Spirakis keys)
+            weights = self._noise_field(width, height, gen).ravel()[free_cells] ** 3 + 1e-6
+            keys = np.log(gen.random(free_cells.size)) / weights
+            chosen = free_cells[np.argpartition(-keys, count - 1)[:count]]
+        else:
+            chosen = gen.choice(free_cells, size=count, replace=False)
+        chosen.sort()
+        
+        obstacle_types = theme_data['obstacles']
+        sprites = theme_data['sprites']
+        type_field = self._noise_field(width, height, gen).ravel()[chosen]
+        type_index = np.minimum((type_field * len(obstacle_types)).astype(int), len(obstacle_types) - 1)
+        ys, xs = np.divmod(chosen, width)
+        
+        obstacles = []
+        for x, y, t in zip(xs.tolist(), ys.tolist(), type_index.tolist()):
+            obstacle_type = obstacle_types[t]
+            obstacles.append({
+                'x': x,
+                'y': y,
+                'attributes': {
+                    'type': obstacle_type,
+                    'sprite_id': sprites[obstacle_type]
+                }
+            })
+        return obstacles
+    
+    def _noise_field(self, width: int, height: int, gen: np.random.Generator) -> np.ndarray:
+        """Pick a precomputed noise field for this size and shift it randomly"""
+        bank = _noise_bank(width, height)
+        field = bank[gen.integers(len(bank))]
+        return np.roll(field, (int(gen.integers(height)), int(gen.integers(width))), axis=(0, 1))
+    
     def _validate_map(self, map_data: Dict) -> bool:
-        """Validate that the generated map is playable"""
+        """Validate that the generated map is playable (generator version 1 rules)"""
         # Check that path exists and is reasonable length
         if len(map_data['path']) < 3:
             return False
@@ -349,19 +593,51 @@ class MapGenerator:
             return False
         
         # Check that obstacles don't block path
-        path_positions = {(start['x'], start['y'])}
-        for point in map_data['path']:
-            path_positions.add((point['x'], point['y']))
+        width = map_data['dimensions']['width']
+        height = map_data['dimensions']['height']
+        on_path = bytearray(width * height)
+        for point in [start] + map_data['path']:
+            if 0 <= point['x'] < width and 0 <= point['y'] < height:
+                on_path[point['y'] * width + point['x']] = 1
         
         for obstacle in map_data['obstacles']:
-            if (obstacle['x'], obstacle['y']) in path_positions:
+            if on_path[obstacle['y'] * width + obstacle['x']]:
                 return False
         
         return True
     
-    def _generate_map_id(self) -> int:
-        """Generate a unique map ID"""
-        return random.randint(1000, 9999)
+    def _validate_grid(self, map_data: Dict) -> Tuple[bool, Dict]:
+        """
+        Validate a map on its occupancy grid (generator version 2 rules)
+        The path is rasterized cell by cell between its points, then a BFS over
+        path cells must lead from start to exit without touching an obstacle.
+        Returns (valid, info) where info holds path and buildable cell counts.
+        """
+        if len(map_data['path']) < 3:
+            return False, {}
+        
+        grid = MapGrid.from_json(map_data)
+        if grid.out_of_bounds or grid.conflicts:
+            return False, {}
+        if grid.exit == grid.start or not grid.path_connected():
+            return False, {}
+        
+        # Buildable area: in-bounds cells that are neither path nor obstacle
+        area = grid.width * grid.height
+        buildable = grid.buildable_count()
+        buildable_ratio = buildable / area
+        if buildable_ratio < self.min_buildable_ratio:
+            return False, {}
+        
+        return True, {
+            'path_cells': int(np.count_nonzero(grid.path_mask())),
+            'buildable_cells': buildable,
+            'buildable_ratio': round(buildable_ratio, 4)
+        }
+    
+    def _generate_map_id(self, rng: random.Random) -> int:
+        """Generate a map ID (derived from the seed, so it is reproducible too)"""
+        return rng.randint(1000, 9999)
     
     def get_themes(self) -> Dict:
         """Return available themes"""
@@ -372,6 +648,15 @@ class MapGenerator:
         """Return available difficulty levels"""
         return list(self.difficulty_settings.keys())
     
+    def get_sizes(self) -> List[str]:
+        """Return available map sizes"""
+        return list(self.size_settings.keys())
+
+    def get_max_dimensions(self) -> Tuple[int, int]:
+        """Return the largest width and height of any map size"""
+        return (max(w for w, _ in self.size_settings.values()),
+                max(h for _, h in self.size_settings.values()))
+
     def get_complexities(self) -> List[str]:
         """Return available complexity patterns"""
         return list(self.complexity_patterns.keys())
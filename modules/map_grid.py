@@ -0,0 +1,310 @@
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Cell type codes stored in MapGrid.cells
+BUILDABLE = 0
+PATH = 1
+OBSTACLE = 2
+START = 3
+EXIT = 4
+
+# Keys of the JSON map shape that MapGrid stores in its own buffers
+GEOMETRY_KEYS = ('start', 'path', 'obstacles', 'dimensions')
+
+
+def rasterize_segment(x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int]]:
+    """
+    Cells on the way from (x0, y0) to (x1, y1), excluding the first one.
+    Uses the same stepping as MapGenerator._create_smooth_path (8-connected).
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    steps = max(abs(dx), abs(dy))
+    return [(int(x0 + dx * i / steps), int(y0 + dy * i / steps)) for i in range(1, steps + 1)]
+
+
+def _check_cell(name: str, point, width: int, height: int):
+    """Raise ValueError unless point is a {'x', 'y'} object inside the grid"""
+    if not isinstance(point, dict):
+        raise ValueError(f'{name} must be an object with x and y')
+    for axis, size in (('x', width), ('y', height)):
+        value = point.get(axis)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f'{name}.{axis} must be an integer')
+        if not 0 <= value < size:
+            raise ValueError(f'{name}.{axis} must be between 0 and {size - 1}')
+
+
+def check_geometry(map_data: Dict, max_width: int, max_height: int):
+    """
+    Validate the geometry of a submitted JSON map before it is built into a grid.
+    Raises ValueError if the dimensions exceed max_width x max_height or a
+    start, path or obstacle cell falls outside them.
+    """
+    if not isinstance(map_data, dict):
+        raise ValueError('map must be an object')
+    dimensions = map_data.get('dimensions')
+    if not isinstance(dimensions, dict):
+        raise ValueError('dimensions must be an object with width and height')
+    width = dimensions.get('width')
+    height = dimensions.get('height')
+    for name, value, maximum in (('width', width, max_width), ('height', height, max_height)):
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f'dimensions.{name} must be an integer')
+        if not 1 <= value <= maximum:
+            raise ValueError(f'dimensions.{name} must be between 1 and {maximum}')
+
+    if 'start' in map_data:
+        _check_cell('start', map_data['start'], width, height)
+    for key in ('path', 'obstacles'):
+        points = map_data.get(key, [])
+        if not isinstance(points, list):
+            raise ValueError(f'{key} must be a list')
+        if len(points) > width * height:
+            raise ValueError(f'{key} has more points than the grid has cells')
+        for i, point in enumerate(points):
+            _check_cell(f'{key}[{i}]', point, width, height)
+
+
+def _freeze(value):
+    """Hashable form of a JSON value, used to intern obstacle attributes"""
+    if isinstance(value, dict):
+        return ('{', tuple((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return ('[', tuple(_freeze(v) for v in value))
+    return value
+
+
+def _thaw(value):
+    """Inverse of _freeze, returning fresh dicts and lists"""
+    if isinstance(value, tuple):
+        if value[0] == '{':
+            return {k: _thaw(v) for k, v in value[1]}
+        return [_thaw(v) for v in value[1]]
+    return value
+
+
+def path_buffer(points: List[Dict]) -> array:
+    """Pack a list of {'x', 'y'} points into a flat array('h') buffer"""
+    buffer = array('h')
+    for point in points:
+        buffer.append(point['x'])
+        buffer.append(point['y'])
+    return buffer
+
+
+class MapGrid:
+    """
+    Compact in-memory map: a uint8 cell grid plus int16 coordinate buffers
+    Paths and obstacles are flat array('h') buffers [x0, y0, x1, y1, ...];
+    obstacle attributes are interned in a small kinds table. The JSON shape
+    used by the API is only produced by to_json().
+    """
+
+    __slots__ = ('width', 'height', 'cells', 'start', 'path', 'obstacles', 'obstacle_kinds',
+                 'kinds', 'extras', 'meta', 'has_dimensions', 'conflicts', 'out_of_bounds')
+
+    def __init__(self, width: int, height: int, start: Tuple[int, int], path: array,
+                 obstacles: Optional[array] = None, obstacle_kinds: Optional[array] = None,
+                 kinds: Optional[List[tuple]] = None, extras: Optional[Dict[int, Dict]] = None,
+                 meta: Optional[Dict] = None, has_dimensions: bool = True):
+        self.width = width
+        self.height = height
+        self.start = start
+        self.path = path
+        self.obstacles = obstacles if obstacles is not None else array('h')
+        self.obstacle_kinds = obstacle_kinds if obstacle_kinds is not None else array('H')
+        self.kinds = kinds or []
+        self.extras = extras or {}  # extra keys of start (-1) and path points (index)
+        self.meta = meta or {}
+        self.has_dimensions = has_dimensions
+        self.cells = np.zeros((height, width), dtype=np.uint8)
+        self.conflicts = 0        # obstacles placed on path cells
+        self.out_of_bounds = 0    # path cells outside the grid
+        self._paint()
+
+    @classmethod
+    def from_json(cls, map_data: Dict) -> 'MapGrid':
+        """Build a grid from the JSON map shape"""
+        start = map_data.get('start', {'x': 0, 'y': 0})
+        points = map_data.get('path') or []
+        path = array('h')
+        extras = {}
+        start_extra = {k: v for k, v in start.items() if k not in ('x', 'y')}
+        if start_extra:
+            extras[-1] = start_extra
+        for i, point in enumerate(points):
+            path.append(point.get('x', 0))
+            path.append(point.get('y', 0))
+            extra = {k: v for k, v in point.items() if k not in ('x', 'y')}
+            if extra:
+                extras[i] = extra
+
+        obstacles = array('h')
+        obstacle_kinds = array('H')
+        kinds = []
+        kind_index = {}
+        for obstacle in map_data.get('obstacles', []):
+            obstacles.append(obstacle['x'])
+            obstacles.append(obstacle['y'])
+            kind = _freeze({k: v for k, v in obstacle.items() if k not in ('x', 'y')})
+            if kind not in kind_index:
+                kind_index[kind] = len(kinds)
+                kinds.append(kind)
+            obstacle_kinds.append(kind_index[kind])
+
+        if 'dimensions' in map_data:
+            width = map_data['dimensions']['width']
+            height = map_data['dimensions']['height']
+            has_dimensions = True
+        else:
+            # Estimate from the path, with some padding
+            width = max(max(path[0::2], default=0), start.get('x', 0)) + 5
+            height = max(max(path[1::2], default=0), start.get('y', 0)) + 5
+            has_dimensions = False
+
+        # Keep the original key order; geometry keys are placeholders filled by to_json
+        meta = {k: (None if k in GEOMETRY_KEYS else v) for k, v in map_data.items()}
+        return cls(width, height, (start.get('x', 0), start.get('y', 0)), path,
+                   obstacles, obstacle_kinds, kinds, extras, meta, has_dimensions)
+
+    def to_json(self, include_dimensions: Optional[bool] = None) -> Dict:
+        """Expand back into the JSON map shape (the API edge)"""
+        start = {'x': self.start[0], 'y': self.start[1]}
+        start.update(self.extras.get(-1, {}))
+        path = []
+        for i in range(len(self.path) // 2):
+            point = {'x': self.path[2 * i], 'y': self.path[2 * i + 1]}
+            if i in self.extras:
+                point.update(self.extras[i])
+            path.append(point)
+        obstacles = []
+        for i, kind in enumerate(self.obstacle_kinds):
+            obstacle = {'x': self.obstacles[2 * i], 'y': self.obstacles[2 * i + 1]}
+            obstacle.update(_thaw(self.kinds[kind]))
+            obstacles.append(obstacle)
+
+        geometry = {
+            'start': start,
+            'path': path,
+            'obstacles': obstacles,
+            'dimensions': {'width': self.width, 'height': self.height}
+        }
+        if include_dimensions is None:
+            include_dimensions = self.has_dimensions
+
+        map_data = {}
+        for key, value in self.meta.items():
+            map_data[key] = geometry[key] if key in GEOMETRY_KEYS else value
+        for key in ('start', 'path', 'obstacles'):
+            map_data.setdefault(key, geometry[key])
+        if include_dimensions:
+            map_data['dimensions'] = geometry['dimensions']
+        elif 'dimensions' in map_data:
+            del map_data['dimensions']
+        return map_data
+
+    def _paint(self):
+        """Fill the cell grid from the path and obstacle buffers"""
+        cells = self.cells
+        route = [self.start] + [(self.path[i], self.path[i + 1]) for i in range(0, len(self.path), 2)]
+        path_cells = [route[0]]
+        for (x0, y0), (x1, y1) in zip(route, route[1:]):
+            path_cells.extend(rasterize_segment(x0, y0, x1, y1))
+        for x, y in path_cells:
+            if 0 <= x < self.width and 0 <= y < self.height:
+                cells[y, x] = PATH
+            else:
+                self.out_of_bounds += 1
+        if self.in_bounds(*self.start):
+            cells[self.start[1], self.start[0]] = START
+        if len(route) > 1 and self.in_bounds(*route[-1]):
+            cells[route[-1][1], route[-1][0]] = EXIT
+
+        for i in range(0, len(self.obstacles), 2):
+            x, y = self.obstacles[i], self.obstacles[i + 1]
+            if not self.in_bounds(x, y):
+                continue
+            if cells[y, x] == BUILDABLE:
+                cells[y, x] = OBSTACLE
+            else:
+                self.conflicts += 1
+
+    def kind_table(self) -> List[Dict]:
+        """Obstacle attribute table indexed by obstacle_kinds"""
+        return [_thaw(kind) for kind in self.kinds]
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    @property
+    def exit(self) -> Tuple[int, int]:
+        if len(self.path) < 2:
+            return self.start
+        return self.path[-2], self.path[-1]
+
+    @property
+    def path_length(self) -> int:
+        """Number of path points (not counting start)"""
+        return len(self.path) // 2
+
+    @property
+    def obstacle_count(self) -> int:
+        return len(self.obstacle_kinds)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the geometry buffers"""
+        return (self.cells.nbytes + self.path.itemsize * len(self.path) +
+                self.obstacles.itemsize * len(self.obstacles) +
+                self.obstacle_kinds.itemsize * len(self.obstacle_kinds))
+
+    def path_mask(self) -> np.ndarray:
+        """Boolean mask of path cells (including start and exit)"""
+        return (self.cells != BUILDABLE) & (self.cells != OBSTACLE)
+
+    def near_path_mask(self) -> np.ndarray:
+        """Path cells dilated by their 3x3 neighbourhood"""
+        padded = np.pad(self.path_mask(), 1)
+        near = np.zeros((self.height, self.width), dtype=bool)
+        for dy in range(3):
+            for dx in range(3):
+                near |= padded[dy:dy + self.height, dx:dx + self.width]
+        return near
+
+    def buildable_count(self) -> int:
+        return int(np.count_nonzero(self.cells == BUILDABLE))
+
+    def path_connected(self) -> bool:
+        """BFS over path cells (8-connected) from start to exit"""
+        if not (self.in_bounds(*self.start) and self.in_bounds(*self.exit)):
+            return False
+        walkable = self.path_mask().ravel()
+        width = self.width
+        start = self.start[1] * width + self.start[0]
+        goal = self.exit[1] * width + self.exit[0]
+        seen = bytearray(self.width * self.height)
+        seen[start] = 1
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            if cell == goal:
+                return True
+            y, x = divmod(cell, width)
+            for dy in (-1, 0, 1):
+                ny = y + dy
+                if not 0 <= ny < self.height:
+                    continue
+                for dx in (-1, 0, 1):
+                    nx = x + dx
+                    if not 0 <= nx < width:
+                        continue
+                    neighbour = ny * width + nx
+                    if walkable[neighbour] and not seen[neighbour]:
+                        seen[neighbour] = 1
+                        queue.append(neighbour)
+        return False
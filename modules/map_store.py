@@ -0,0 +1,375 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules import map_wire
+from modules.content_cache import CachedContent, serialize_json
+from modules.map_generator import MapGenerator
+from modules.map_grid import MapGrid
+from modules.metrics import phases
+from modules.path_table import build_path_table
+
+
+class MapNotFoundError(LookupError):
+    """Raised when no map is stored under the requested ID"""
+
+
+def summarize_map(grid: MapGrid, seq: int) -> Dict:
+    """Build the loader summary for a map stored at position seq"""
+    meta = grid.meta
+    map_id = meta.get('id', seq)
+    return {
+        'id': str(map_id),
+        'name': meta.get('name', f'Map {map_id}'),
+        'theme': meta.get('theme', 'forest'),
+        'difficulty': meta.get('difficulty', 'medium'),
+        'width': grid.width,
+        'height': grid.height,
+        'obstacle_count': grid.obstacle_count,
+        'created_at': meta.get('created_at', f'2024-01-{str(seq).zfill(2)}T00:00:00Z')
+    }
+
+
+def encode_cursor(created_at: str, seq: int) -> str:
+    """Opaque pagination cursor pointing just past (created_at, seq)"""
+    return base64.urlsafe_b64encode(f'{created_at}|{seq}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor, raises ValueError for malformed cursors"""
+    try:
+        created_at, seq = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(seq)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+class MapStore:
+    """
+    SQLite-backed storage for all maps (built-in and user generated)
+    Every map is one row keyed by an autoincrement sequence number (which
+    keeps the original maps.json order) with an index on its ID, so saves
+    and lookups no longer touch the other maps.
+    A summary row per map backs the paginated map loader.
+    Every stored map carries its path table (see modules/path_table.py).
+    Unmodified generated maps are stored as parameters plus seed and
+    expanded on read.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS maps (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            map_id TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_maps_map_id ON maps (map_id, seq);
+        CREATE TABLE IF NOT EXISTS map_summaries (
+            seq INTEGER PRIMARY KEY REFERENCES maps (seq),
+            map_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            theme TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            obstacle_count INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            difficulty_score REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_map_summaries_created ON map_summaries (created_at, seq);
+        CREATE INDEX IF NOT EXISTS idx_map_summaries_name ON map_summaries (name);
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = 'map_data/maps.db',
+                 legacy_json_path: Optional[str] = 'map_data/maps.json',
+                 generator: Optional[MapGenerator] = None):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self.generator = generator or MapGenerator()
+        self._local = threading.local()
+        self._snapshot: Optional[CachedContent] = None
+        # JSON body of every map in the snapshot, per tuple of included optional fields
+        self._snapshot_fragments: Dict[Tuple[str, ...], List[bytes]] = {}
+        self._snapshot_lock = threading.Lock()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn: sqlite3.Connection):
+        """Create the schema and run the one-shot migration from maps.json"""
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.executescript(self.SCHEMA)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Stores created before difficulty scores existed
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(map_summaries)')}
+                if 'difficulty_score' not in columns:
+                    conn.execute('ALTER TABLE map_summaries ADD COLUMN difficulty_score REAL')
+                migrated = conn.execute(
+                    "SELECT value FROM store_meta WHERE key = 'migrated_from_json'"
+                ).fetchone()
+                if not migrated:
+                    self._migrate_legacy_json(conn)
+                    conn.execute(
+                        "INSERT INTO store_meta (key, value) VALUES ('migrated_from_json', '1')"
+                    )
+                self._backfill_summaries(conn)
+                tabled = conn.execute(
+                    "SELECT value FROM store_meta WHERE key = 'path_tables'"
+                ).fetchone()
+                if not tabled:
+                    self._backfill_path_tables(conn)
+                    conn.execute("INSERT INTO store_meta (key, value) VALUES ('path_tables', '1')")
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self._initialized = True
+
+    def _migrate_legacy_json(self, conn: sqlite3.Connection):
+        """Import every map from the legacy maps.json in file order"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        with open(self.legacy_json_path, 'r') as f:
+            legacy_maps = json.load(f)
+        for map_data in legacy_maps:
+            self._insert(conn, map_data)
+
+    def _backfill_summaries(self, conn: sqlite3.Connection):
+        """Create summaries for maps stored before the summary index existed"""
+        rows = conn.execute(
+            'SELECT maps.seq, maps.data FROM maps '
+            'LEFT JOIN map_summaries ON map_summaries.seq = maps.seq '
+            'WHERE map_summaries.seq IS NULL'
+        ).fetchall()
+        for seq, data in rows:
+            self._insert_summary(conn, seq, MapGrid.from_json(self._decode(data)))
+
+    def _backfill_path_tables(self, conn: sqlite3.Connection):
+        """Add path tables to maps stored before they existed (seed records get theirs on expansion)"""
+        rows = conn.execute('SELECT seq, data FROM maps').fetchall()
+        for seq, data in rows:
+            stored = json.loads(data)
+            if stored.get('seed_only') or 'path_table' in stored:
+                continue
+            stored['path_table'] = build_path_table(stored)
+            conn.execute('UPDATE maps SET data = ? WHERE seq = ?', (self._encode(stored), seq))
+
+    def _encode(self, map_data: Dict) -> str:
+        """Serialize a map for storage, as a seed record when possible"""
+        stored = self.generator.to_seed_record(map_data) or map_data
+        return json.dumps(stored, separators=(',', ':'))
+
+    def _decode(self, data: str) -> Dict:
+        """Inverse of _encode"""
+        stored = json.loads(data)
+        if stored.get('seed_only'):
+            return self.generator.from_seed_record(stored)
+        return stored
+
+    def _insert(self, conn: sqlite3.Connection, map_data: Dict,
+                difficulty_score: Optional[float] = None) -> int:
+        if 'path_table' not in map_data:
+            map_data = dict(map_data, path_table=build_path_table(map_data))
+        cursor = conn.execute(
+            'INSERT INTO maps (map_id, data) VALUES (?, ?)',
+            (str(map_data.get('id')), self._encode(map_data))
+        )
+        self._insert_summary(conn, cursor.lastrowid, MapGrid.from_json(map_data), difficulty_score)
+        return cursor.lastrowid
+
+    def _insert_summary(self, conn: sqlite3.Connection, seq: int, grid: MapGrid,
+                        difficulty_score: Optional[float] = None):
+        summary = summarize_map(grid, seq)
+        conn.execute(
+            'INSERT INTO map_summaries (seq, map_id, name, theme, difficulty, width, height, '
+            'obstacle_count, created_at, difficulty_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (seq, summary['id'], summary['name'], summary['theme'], summary['difficulty'],
+             summary['width'], summary['height'], summary['obstacle_count'], summary['created_at'],
+             difficulty_score)
+        )
+
+    def add(self, map_data: Dict, difficulty_score: Optional[float] = None) -> str:
+        """Append a map in a single atomic transaction and return its ID"""
+        conn = self._connect()
+        with phases.time('db'):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._insert(conn, map_data, difficulty_score)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return str(map_data.get('id'))
+
+    def get(self, map_id) -> Optional[Dict]:
+        """Return the first map saved under map_id in its JSON shape, or None"""
+        grid = self.get_grid(map_id)
+        return grid.to_json() if grid else None
+
+    def has_map(self, key: str) -> bool:
+        """True if a map is saved with key as its ID or its name"""
+        with phases.time('db'):
+            row = self._connect().execute(
+                'SELECT EXISTS (SELECT 1 FROM maps WHERE map_id = ?) '
+                'OR EXISTS (SELECT 1 FROM map_summaries WHERE name = ?)',
+                (key, key)
+            ).fetchone()
+        return bool(row[0])
+
+    def get_grid(self, map_id) -> Optional[MapGrid]:
+        """Return the first map saved under map_id as a MapGrid, or None"""
+        with phases.time('db'):
+            row = self._connect().execute(
+                'SELECT data FROM maps WHERE map_id = ? ORDER BY seq LIMIT 1',
+                (str(map_id),)
+            ).fetchone()
+        return MapGrid.from_json(self._decode(row[0])) if row else None
+
+    def list_summaries(self, limit: int = 50,
+                       cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Return one page of map summaries, newest first, and the cursor for the next page.
+        Uses keyset pagination on (created_at, seq), so each page costs O(limit).
+        """
+        query = ('SELECT seq, map_id, name, theme, difficulty, width, height, '
+                 'obstacle_count, created_at, difficulty_score FROM map_summaries')
+        params: list = []
+        if cursor:
+            created_at, seq = decode_cursor(cursor)
+            query += ' WHERE (created_at, seq) < (?, ?)'
+            params.extend([created_at, seq])
+        query += ' ORDER BY created_at DESC, seq DESC LIMIT ?'
+        params.append(limit + 1)
+
+        with phases.time('db'):
+            rows = self._connect().execute(query, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[8], last[0])
+
+        summaries = [{
+            'id': row[1],
+            'name': row[2],
+            'theme': row[3],
+            'difficulty': row[4],
+            'dimensions': {'width': row[5], 'height': row[6]},
+            'obstacle_count': row[7],
+            'created_at': row[8],
+            'difficulty_score': row[9]
+        } for row in rows]
+        return summaries, next_cursor
+
+    def iter_grids(self, missing_difficulty_only: bool = False,
+                   chunk: int = 1000) -> Iterator[List[Tuple[int, MapGrid]]]:
+        """Yield all maps as lists of up to chunk (seq, MapGrid) pairs, in seq order"""
+        query = ('SELECT maps.seq, maps.data FROM maps JOIN map_summaries ON map_summaries.seq = maps.seq '
+                 'WHERE maps.seq > ?')
+        if missing_difficulty_only:
+            query += ' AND map_summaries.difficulty_score IS NULL'
+        query += ' ORDER BY maps.seq LIMIT ?'
+        last = 0
+        while True:
+            with phases.time('db'):
+                rows = self._connect().execute(query, (last, chunk)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [(seq, MapGrid.from_json(self._decode(data))) for seq, data in rows]
+
+    def set_difficulty_scores(self, scores: Iterable[Tuple[int, float]]):
+        """Store (seq, difficulty score) pairs in one transaction"""
+        conn = self._connect()
+        with phases.time('db'):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('UPDATE map_summaries SET difficulty_score = ? WHERE seq = ?',
+                                 [(score, seq) for seq, score in scores])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def all(self) -> List[Dict]:
+        """Return every map in insertion order, in the JSON shape"""
+        return [grid.to_json() for grid in self.snapshot().data]
+
+    def version(self) -> int:
+        """
+        Last map seq. Maps are only ever appended and seq never goes back,
+        so it changes whenever a map is added; MAX on the rowid is one lookup.
+        """
+        with phases.time('db'):
+            row = self._connect().execute('SELECT COALESCE(MAX(seq), 0) FROM maps').fetchone()
+        return row[0]
+
+    def snapshot(self, include: Collection[str] = ()) -> CachedContent:
+        """
+        Return all maps as MapGrids with a pre-serialized body and ETag.
+        The body has the optional fields in include (see map_wire.OPTIONAL_FIELDS).
+        Updated only when the store version changes (also across processes),
+        by loading and serializing just the maps added since, so older seed
+        records are not expanded again.
+        """
+        include = tuple(name for name in map_wire.OPTIONAL_FIELDS if name in include)
+        version = self.version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._snapshot_lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    last_seq = snapshot.version if snapshot is not None else 0
+                    with phases.time('db'):
+                        rows = self._connect().execute(
+                            'SELECT data FROM maps WHERE seq > ? AND seq <= ? ORDER BY seq', (last_seq, version)
+                        ).fetchall()
+                    added = [MapGrid.from_json(self._decode(row[0])) for row in rows]
+                    grids = (snapshot.data if snapshot is not None else []) + added
+                    snapshot = CachedContent(self.db_path, grids, self._snapshot_body(grids, ()), version)
+                    self._snapshot = snapshot
+        if not include:
+            return snapshot
+
+        # Bodies with optional fields hang off the snapshot they were built from
+        try:
+            return snapshot.derived[include]
+        except KeyError:
+            with self._snapshot_lock:
+                if include not in snapshot.derived:
+                    body = self._snapshot_body(snapshot.data, include)
+                    snapshot.derived[include] = CachedContent(self.db_path, snapshot.data, body, version)
+                return snapshot.derived[include]
+
+    def _snapshot_body(self, grids: List[MapGrid], include: Tuple[str, ...]) -> bytes:
+        """JSON array of grids, serializing only the grids added since the last call for include"""
+        fragments = self._snapshot_fragments.get(include, [])
+        if len(fragments) < len(grids):
+            # The JSON shape only lives long enough to build the new maps' fragments
+            fragments = fragments + [
+                serialize_json(map_wire.without_optional(grid.to_json(), include))
+                for grid in grids[len(fragments):]
+            ]
+            self._snapshot_fragments[include] = fragments
+        # Maps are only ever appended, so an older snapshot's maps are a prefix
+        return b'[' + b','.join(fragments[:len(grids)]) + b']'
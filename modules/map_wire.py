@@ -0,0 +1,228 @@
+"""
+Wire formats for map payloads
+
+    json     the existing map shape (application/json)
+    compact  JSON with flat [x0, y0, x1, y1, ...] coordinate arrays
+    binary   struct-packed coordinates plus obstacle kind codes
+
+Every format can be sent gzip- or brotli-compressed (brotli only if the
+optional brotli package is installed).
+"""
+import copy
+import gzip
+import hashlib
+import json
+import struct
+import threading
+from collections import OrderedDict
+from typing import Callable, Collection, Dict, List, Optional
+
+from modules.content_cache import serialize_json
+from modules.map_grid import GEOMETRY_KEYS, MapGrid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'compact': 'application/vnd.towerdefense.map-compact+json',
+    'binary': 'application/vnd.towerdefense.map-binary'
+}
+FORMAT_BY_MEDIA_TYPE = {media_type: fmt for fmt, media_type in MEDIA_TYPES.items()}
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+MIN_COMPRESS_SIZE = 512  # smaller bodies are sent as they are
+
+BINARY_MAGIC = b'TDMP'
+BINARY_VERSION = 1
+_HEADER = struct.Struct('<4sHI')      # magic, version, map count
+_MAP_HEADER = struct.Struct('<IhhhhIIB')  # meta length, width, height, start x/y, path/obstacle counts, kind width
+
+# Stored map fields that clients can derive themselves (the path table from
+# the path); they are only sent when asked for, e.g. ?include=path_table
+OPTIONAL_FIELDS = ('path_table',)
+
+
+def without_optional(map_data: Dict, include: Collection[str] = ()) -> Dict:
+    """map_data without the optional fields that are not in include"""
+    return {k: v for k, v in map_data.items() if k not in OPTIONAL_FIELDS or k in include}
+
+
+def _meta(grid: MapGrid, include: Collection[str] = ()) -> Dict:
+    """Non-geometry fields of a map plus the tables the packed forms refer to"""
+    meta = {k: v for k, v in without_optional(grid.meta, include).items() if k not in GEOMETRY_KEYS}
+    meta['kinds'] = grid.kind_table()
+    if grid.extras:
+        meta['extras'] = {str(i): extra for i, extra in grid.extras.items()}
+    return meta
+
+
+def _apply_extras(map_data: Dict, extras: Dict):
+    """Merge start (-1) and path point extras back into a JSON-shape map"""
+    for index, extra in extras.items():
+        index = int(index)
+        if index == -1:
+            map_data['start'].update(extra)
+        else:
+            map_data['path'][index].update(extra)
+
+
+def compact_map(grid: MapGrid, include: Collection[str] = ()) -> Dict:
+    """Compact JSON form of one map"""
+    compact = _meta(grid, include)
+    compact.update({
+        'dimensions': [grid.width, grid.height],
+        'start': list(grid.start),
+        'path': grid.path.tolist(),
+        'obstacles': grid.obstacles.tolist(),
+        'obstacle_kinds': grid.obstacle_kinds.tolist()
+    })
+    return compact
+
+
+def expand_compact(compact: Dict) -> Dict:
+    """Inverse of compact_map, returning the JSON map shape"""
+    compact = dict(compact)
+    kinds = compact.pop('kinds')
+    extras = compact.pop('extras', {})
+    path = compact.pop('path')
+    obstacles = compact.pop('obstacles')
+    obstacle_kinds = compact.pop('obstacle_kinds')
+    width, height = compact.pop('dimensions')
+    start = compact.pop('start')
+
+    map_data = compact
+    map_data['start'] = {'x': start[0], 'y': start[1]}
+    map_data['path'] = [{'x': path[i], 'y': path[i + 1]} for i in range(0, len(path), 2)]
+    map_data['obstacles'] = []
+    for i, kind in enumerate(obstacle_kinds):
+        obstacle = {'x': obstacles[2 * i], 'y': obstacles[2 * i + 1]}
+        obstacle.update(copy.deepcopy(kinds[kind]))
+        map_data['obstacles'].append(obstacle)
+    map_data['dimensions'] = {'width': width, 'height': height}
+    _apply_extras(map_data, extras)
+    return map_data
+
+
+def pack_maps(grids: List[MapGrid], include: Collection[str] = ()) -> bytes:
+    """
+    Binary form of a list of maps (little endian):
+    header, then per map a fixed header, the meta JSON, int16 path and
+    obstacle coordinates and one uint8 (or uint16) kind code per obstacle.
+    """
+    parts = [_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(grids))]
+    for grid in grids:
+        meta = serialize_json(_meta(grid, include))
+        kind_width = 1 if len(grid.kinds) <= 256 else 2
+        parts.append(_MAP_HEADER.pack(len(meta), grid.width, grid.height, grid.start[0], grid.start[1],
+                                      len(grid.path) // 2, grid.obstacle_count, kind_width))
+        parts.append(meta)
+        parts.append(struct.pack(f'<{len(grid.path)}h', *grid.path))
+        parts.append(struct.pack(f'<{len(grid.obstacles)}h', *grid.obstacles))
+        code = 'B' if kind_width == 1 else 'H'
+        parts.append(struct.pack(f'<{grid.obstacle_count}{code}', *grid.obstacle_kinds))
+    return b''.join(parts)
+
+
+def unpack_maps(body: bytes) -> List[Dict]:
+    """Inverse of pack_maps, returning maps in the JSON shape"""
+    magic, version, count = _HEADER.unpack_from(body, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError('Not a packed map payload')
+    offset = _HEADER.size
+    maps = []
+    for _ in range(count):
+        (meta_len, width, height, start_x, start_y,
+         path_len, obstacle_count, kind_width) = _MAP_HEADER.unpack_from(body, offset)
+        offset += _MAP_HEADER.size
+        meta = json.loads(body[offset:offset + meta_len])
+        offset += meta_len
+        path = struct.unpack_from(f'<{2 * path_len}h', body, offset)
+        offset += 4 * path_len
+        obstacles = struct.unpack_from(f'<{2 * obstacle_count}h', body, offset)
+        offset += 4 * obstacle_count
+        code = 'B' if kind_width == 1 else 'H'
+        obstacle_kinds = struct.unpack_from(f'<{obstacle_count}{code}', body, offset)
+        offset += kind_width * obstacle_count
+
+        meta.update({
+            'dimensions': [width, height],
+            'start': [start_x, start_y],
+            'path': path,
+            'obstacles': obstacles,
+            'obstacle_kinds': obstacle_kinds
+        })
+        maps.append(expand_compact(meta))
+    return maps
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Content-encode a body ('br', 'gzip' or None for identity)"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+
+def decompress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == 'br':
+        return brotli.decompress(body)
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    return body
+
+
+def serialize(grids: List[MapGrid], fmt: str, include: Collection[str] = ()) -> bytes:
+    """Uncompressed body for a list of maps in the given format"""
+    if fmt == 'binary':
+        return pack_maps(grids, include)
+    if fmt == 'compact':
+        return serialize_json([compact_map(grid, include) for grid in grids])
+    return serialize_json([without_optional(grid.to_json(), include) for grid in grids])
+
+
+class Representation:
+    """One encoded variant of a response body, with its own strong ETag"""
+
+    __slots__ = ('body', 'etag', 'mimetype', 'encoding')
+
+    def __init__(self, body: bytes, fmt: str, encoding: Optional[str]):
+        if len(body) < MIN_COMPRESS_SIZE:
+            encoding = None
+        self.body = compress(body, encoding)
+        self.etag = hashlib.sha256(self.body).hexdigest()
+        self.mimetype = MEDIA_TYPES[fmt]
+        self.encoding = encoding
+
+
+class RepresentationCache:
+    """
+    Bounded LRU of encoded bodies keyed by (key, format, encoding)
+    Compression runs once per variant; later requests reuse the bytes.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[tuple, Representation]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, fmt: str, encoding: Optional[str],
+            build: Callable[[str], bytes]) -> Representation:
+        """Return the cached variant, calling build(fmt) for the raw body on a miss"""
+        cache_key = (key, fmt, encoding)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                return entry
+
+        entry = Representation(build(fmt), fmt, encoding)
+        with self._lock:
+            self._entries[cache_key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
@@ -0,0 +1,324 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; dead worker files are then kept as they are
+    fcntl = None
+
+
+# Latency buckets in seconds and size buckets in bytes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def _series(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def _reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def _merge(into: Dict, series: Iterable[list]):
+        for key, value in series:
+            key = tuple(key)
+            into[key] = into.get(key, 0.0) + value
+
+    def _render(self, merged: Dict) -> List[str]:
+        return [f'{self.name}_total{_label_text(self.labels, key)} {_format_value(value)}'
+                for key, value in sorted(merged.items())]
+
+
+class Histogram:
+    """
+    Bucketed distribution with optional labels
+    Per-bucket counts are stored non-cumulatively so observe() is a single
+    bisect and two additions; they are accumulated only when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # labels -> [counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def _series(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(value)] for key, value in self._values.items()]
+
+    def _reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _merge(self, into: Dict, series: Iterable[list]):
+        for key, value in series:
+            if len(value) != len(self.buckets) + 2:
+                continue  # written with other buckets by an older release
+            key = tuple(key)
+            current = into.get(key)
+            into[key] = value if current is None else [a + b for a, b in zip(current, value)]
+
+    def _render(self, merged: Dict) -> List[str]:
+        lines = []
+        bounds = self.buckets + (float('inf'),)
+        for key, value in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_count{_label_text(self.labels, key)} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {_format_value(value[-1])}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, rendered in the Prometheus text format
+    With a directory, each process also writes its values to its own file
+    there (at most every flush_interval seconds, from maybe_flush()) and
+    render() sums the files of all processes, so any worker of a pre-fork
+    server can answer a scrape. Files of exited workers are folded into one
+    archive file so the directory does not grow with every restart.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics: Dict[str, object] = {}
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._path = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._claim_file()
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def _claim_file(self):
+        self._pid = os.getpid()
+        self._path = os.path.join(self.directory, f'metrics_{self._pid}_{uuid.uuid4().hex[:8]}.json')
+
+    def _after_fork(self):
+        # A forked worker starts from zero; its parent's values stay in the parent's file
+        for metric in self._metrics.values():
+            metric._reset()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._claim_file()
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """This process's series per metric, in the per-process file format"""
+        return {name: metric._series() for name, metric in self._metrics.items()}
+
+    def maybe_flush(self):
+        """Write this process's file if flush_interval has passed (cheap otherwise)"""
+        if self._path and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._path:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            tmp = f'{self._path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'pid': self._pid, 'metrics': self.snapshot()}, f, separators=(',', ':'))
+            os.replace(tmp, self._path)
+
+    def _read_files(self) -> List[dict]:
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            if path == self._path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced right now or truncated by a crash
+        return snapshots
+
+    def _compact(self):
+        """Fold the files of exited processes into metrics_archive.json"""
+        if fcntl is None:
+            return
+        with open(os.path.join(self.directory, 'metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, 'metrics_archive.json')
+            dead = []
+            for path in glob.glob(os.path.join(self.directory, 'metrics_*_*.json')):
+                try:
+                    pid = int(os.path.basename(path).split('_')[1])
+                    os.kill(pid, 0)
+                except (ValueError, ProcessLookupError):
+                    dead.append(path)
+                except PermissionError:
+                    pass  # alive, owned by someone else
+            if not dead:
+                return
+            snapshots = []
+            for path in [archive_path] + dead:
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+            merged = self._merge(snapshots)
+            archive = {'pid': None, 'metrics': {name: [[list(key), value] for key, value in series.items()]
+                                                for name, series in merged.items()}}
+            tmp = f'{archive_path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(archive, f, separators=(',', ':'))
+            os.replace(tmp, archive_path)
+            for path in dead:
+                os.remove(path)
+
+    def _merge(self, snapshots: Iterable[dict]) -> Dict[str, Dict]:
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, series in snapshot.get('metrics', {}).items():
+                metric = self._metrics.get(name)
+                if metric is not None:
+                    metric._merge(merged[name], series)
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition of all processes (or just this one without a directory)"""
+        snapshots = [{'metrics': self.snapshot()}]
+        if self.directory:
+            self._compact()
+            snapshots.extend(self._read_files())
+        merged = self._merge(snapshots)
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric._render(merged[name]))
+        return '\n'.join(lines) + '\n'
+
+
+class PhaseTimer:
+    """
+    Exclusive time per phase (db, file_io, json, ...) of the current request
+    Phases nest: entering one pauses the enclosing phase, so a JSON dump
+    inside a DB helper is not counted twice. Outside start()/stop() the
+    timer does nothing, which keeps it free for scripts and background work.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start(self):
+        self._local.totals = {}
+        self._local.stack = []
+
+    def stop(self) -> Dict[str, float]:
+        """End the current request and return its seconds per phase"""
+        totals = getattr(self._local, 'totals', None)
+        self._local.totals = None
+        self._local.stack = []
+        return totals or {}
+
+    def enter(self, phase: str):
+        local = self._local
+        if getattr(local, 'totals', None) is None:
+            return
+        now = time.perf_counter()
+        stack = local.stack
+        if stack:
+            outer = stack[-1]
+            local.totals[outer[0]] = local.totals.get(outer[0], 0.0) + now - outer[1]
+        stack.append([phase, now])
+
+    def exit(self):
+        local = self._local
+        if getattr(local, 'totals', None) is None or not local.stack:
+            return
+        now = time.perf_counter()
+        phase, since = local.stack.pop()
+        local.totals[phase] = local.totals.get(phase, 0.0) + now - since
+        if local.stack:
+            local.stack[-1][1] = now
+
+    @contextmanager
+    def time(self, phase: str):
+        self.enter(phase)
+        try:
+            yield
+        finally:
+            self.exit()
+
+
+# Shared by the storage and serialization helpers and the request middleware
+phases = PhaseTimer()
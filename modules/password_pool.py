@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hash jobs are already queued"""
+
+
+def _timed(fn, submitted: float, *args):
+    """Run fn in the pool and report (result, queue seconds, run seconds)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started - submitted, time.perf_counter() - started
+
+
+def _hash(password: str, method: Optional[str]) -> str:
+    if method is None:
+        return generate_password_hash(password)
+    return generate_password_hash(password, method=method)
+
+
+class PasswordHasher:
+    """
+    Password hashing and verification on a small dedicated pool
+    At most max_workers hashes run at once (hashlib releases the GIL, so a
+    thread pool is enough to keep them off the request threads' CPU share)
+    and at most max_queue wait; beyond that PasswordPoolBusy is raised so a
+    login storm cannot pile up unbounded work.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64,
+                 method: Optional[str] = None, use_processes: bool = False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.method = method
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._current_method: Optional[str] = None
+        self._queue_ms = deque(maxlen=1000)
+        self._stats = {'jobs': 0, 'rejected': 0, 'in_flight': 0, 'rehashed': 0,
+                       'total_queue_ms': 0.0, 'max_queue_ms': 0.0, 'total_run_ms': 0.0}
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                self._executor = pool(max_workers=self.max_workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordPoolBusy('Too many password hash jobs queued')
+        try:
+            with self._lock:
+                self._stats['in_flight'] += 1
+            future = self._get_executor().submit(_timed, fn, time.perf_counter(), *args)
+            result, queued, ran = future.result()
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+            self._slots.release()
+
+        with self._lock:
+            stats = self._stats
+            stats['jobs'] += 1
+            stats['total_queue_ms'] += queued * 1000
+            stats['max_queue_ms'] = max(stats['max_queue_ms'], queued * 1000)
+            stats['total_run_ms'] += ran * 1000
+            self._queue_ms.append(queued * 1000)
+        return result
+
+    def hash(self, password: str) -> str:
+        """Hash password with the configured method (blocks until done)"""
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def current_method(self) -> str:
+        """Method string (e.g. 'scrypt:32768:8:1') new hashes are created with"""
+        if self._current_method is None:
+            self._current_method = self.hash('').split('$', 1)[0]
+        return self._current_method
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if password_hash was made with other parameters than the current ones"""
+        return password_hash.split('$', 1)[0] != self.current_method()
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats['rehashed'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts and the time jobs spent waiting for a worker"""
+        with self._lock:
+            stats = dict(self._stats)
+            recent = sorted(self._queue_ms)
+        jobs = stats['jobs']
+        stats['avg_queue_ms'] = stats['total_queue_ms'] / jobs if jobs else 0.0
+        stats['avg_run_ms'] = stats['total_run_ms'] / jobs if jobs else 0.0
+        stats['p95_queue_ms'] = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        for key in ('total_queue_ms', 'max_queue_ms', 'total_run_ms', 'avg_queue_ms',
+                    'avg_run_ms', 'p95_queue_ms'):
+            stats[key] = round(stats[key], 3)
+        stats.update({'max_workers': self.max_workers, 'max_queue': self.max_queue})
+        return stats
@@ -0,0 +1,90 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+# Arc length between lookup table samples, in cells
+LUT_STEP = 0.5
+
+
+def merge_collinear(points: np.ndarray) -> np.ndarray:
+    """Drop repeated points and the inner points of straight runs of an (n, 2) polyline"""
+    if len(points) < 2:
+        return points
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+    points = points[keep]
+    if len(points) < 3:
+        return points
+    d = np.diff(points, axis=0)
+    cross = d[:-1, 0] * d[1:, 1] - d[:-1, 1] * d[1:, 0]
+    dot = np.sum(d[:-1] * d[1:], axis=1)
+    turns = (cross != 0) | (dot <= 0)
+    return points[np.concatenate(([True], turns, [True]))]
+
+
+class PathTable:
+    """
+    Arc-length parametrization of a map path, in cell units
+    The route (start plus path points, walked between cell centres) is
+    reduced to the points where it turns, lengths[i] is the distance
+    travelled on reaching points[i], and the lookup table samples the
+    position every `step` cells, so a position is one index and one
+    interpolation between neighbouring samples.
+    """
+
+    def __init__(self, points: np.ndarray, step: float = LUT_STEP):
+        self.points = merge_collinear(np.asarray(points, dtype=np.int64).reshape(-1, 2))
+        self.step = step
+        segment_lengths = np.hypot(*np.diff(self.points, axis=0).T)
+        self.lengths = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        self.length = float(self.lengths[-1])
+        self.lut_x, self.lut_y = self.sample(step)
+
+    @classmethod
+    def from_map(cls, map_data: Dict, step: float = LUT_STEP) -> 'PathTable':
+        start = map_data.get('start', {'x': 0, 'y': 0})
+        route = [start] + list(map_data.get('path') or [])
+        return cls([(p.get('x', 0), p.get('y', 0)) for p in route], step)
+
+    def sample(self, step: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions every `step` cells of arc length; the last sample is the end of the path"""
+        count = int(np.ceil(self.length / step)) + 1
+        distances = np.minimum(np.arange(count) * step, self.length)
+        return (np.interp(distances, self.lengths, self.points[:, 0]),
+                np.interp(distances, self.lengths, self.points[:, 1]))
+
+    def positions(self, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cell coordinates at each arc length (clamped to the path)"""
+        scaled = np.clip(np.asarray(distances, dtype=np.float64), 0.0, self.length) / self.step
+        index = np.minimum(scaled.astype(np.intp), len(self.lut_x) - 1)
+        after = np.minimum(index + 1, len(self.lut_x) - 1)
+        fraction = scaled - index
+        return (self.lut_x[index] + (self.lut_x[after] - self.lut_x[index]) * fraction,
+                self.lut_y[index] + (self.lut_y[after] - self.lut_y[index]) * fraction)
+
+    def to_json(self) -> Dict:
+        """
+        {"step", "length", "points": [x0, y0, ...], "lengths": [...], "lut": [x0, y0, ...]}
+        lut[2k], lut[2k + 1] is the position after k * step cells of the path.
+        """
+        lut = np.empty(2 * len(self.lut_x))
+        lut[0::2] = self.lut_x
+        lut[1::2] = self.lut_y
+        return {
+            'step': self.step,
+            'length': round(self.length, 4),
+            'points': self.points.ravel().tolist(),
+            'lengths': _rounded(self.lengths, 4),
+            'lut': _rounded(lut, 3)
+        }
+
+
+def _rounded(values: np.ndarray, digits: int) -> List:
+    """Rounded floats, with whole numbers as ints to keep the JSON short"""
+    return [int(v) if v == int(v) else v for v in np.round(values, digits).tolist()]
+
+
+def build_path_table(map_data: Dict) -> Dict:
+    """JSON path table of a map in the JSON shape"""
+    return PathTable.from_map(map_data).to_json()
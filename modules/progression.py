@@ -0,0 +1,74 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional
+
+
+class ProgressionIndex:
+    """
+    Precompiled view of config/progression.json
+    Level lookups are dict hits, level-ups are a bisect over the cumulative
+    XP table and tower unlocks are kept sorted by their level threshold.
+    """
+
+    def __init__(self, progression: Dict):
+        levels = sorted(progression.get('levels', []), key=lambda x: x['level'])
+        self.levels: Dict[int, Dict] = {x['level']: x for x in levels}
+
+        # Cumulative XP table: xp_thresholds[i] is the total XP needed for level_numbers[i].
+        # Running max keeps the table monotonic even if the config is not.
+        self.level_numbers: List[int] = []
+        self.xp_thresholds: List[int] = []
+        self.cumulative_xp: Dict[int, int] = {}
+        highest = 0
+        for level_data in levels:
+            highest = max(highest, level_data.get('xp_required', 0))
+            self.level_numbers.append(level_data['level'])
+            self.xp_thresholds.append(highest)
+            self.cumulative_xp[level_data['level']] = highest
+
+        # Tower unlocks sorted by (level_required, xp_required)
+        unlocks = sorted(
+            progression.get('tower_unlocks', {}).items(),
+            key=lambda item: (item[1]['level_required'], item[1]['xp_required'])
+        )
+        self.unlock_ids: List[str] = [tower_id for tower_id, _ in unlocks]
+        self.unlock_levels: List[int] = [req['level_required'] for _, req in unlocks]
+        self.unlock_xp: List[int] = [req['xp_required'] for _, req in unlocks]
+        # The same unlocks ordered by XP requirement, for XP gains without a level-up
+        self.unlocks_by_xp: List[int] = sorted(range(len(unlocks)), key=lambda i: self.unlock_xp[i])
+        self.sorted_unlock_xp: List[int] = [self.unlock_xp[i] for i in self.unlocks_by_xp]
+
+    def level_data(self, level: int) -> Optional[Dict]:
+        """Return the config entry for a level, or None"""
+        return self.levels.get(level)
+
+    def level_for_xp(self, xp: int, current_level: int) -> int:
+        """
+        Return the highest level reachable with xp, never lower than current_level.
+        Handles several level-ups from a single large XP gain.
+        """
+        pos = bisect_right(self.xp_thresholds, xp)
+        if pos == 0:
+            return current_level
+        return max(current_level, self.level_numbers[pos - 1])
+
+    def xp_for_level(self, level: int) -> Optional[int]:
+        """Return the cumulative XP required to reach level"""
+        return self.cumulative_xp.get(level)
+
+    def newly_unlocked(self, old_level: int, old_xp: int,
+                       new_level: int, new_xp: int) -> Iterable[str]:
+        """
+        Yield the IDs of towers that are reachable at
+        (new_level, new_xp) but were not at (old_level, old_xp), in unlock order.
+        Only unlocks of the levels in (old_level, new_level] and, for levels
+        already reached, those with an XP requirement in (old_xp, new_xp]
+        are looked at.
+        """
+        found = [i for i in range(bisect_right(self.unlock_levels, old_level),
+                                  bisect_right(self.unlock_levels, new_level))
+                 if self.unlock_xp[i] <= new_xp]
+        lo = bisect_right(self.sorted_unlock_xp, old_xp)
+        hi = bisect_right(self.sorted_unlock_xp, new_xp)
+        found.extend(i for i in self.unlocks_by_xp[lo:hi] if self.unlock_levels[i] <= old_level)
+        for i in sorted(found):
+            yield self.unlock_ids[i]
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+# Profile names are generated here; anything else is rejected by path()
+_NAME_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{9}Z-[a-z0-9_-]{1,40}-[0-9]+ms-[0-9a-f]{8}$')
+KINDS = {'prof': 'application/octet-stream', 'txt': 'text/plain; charset=utf-8', 'json': 'application/json'}
+
+
+def _slug(text: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')[:40] or 'root'
+
+
+class RequestProfiler:
+    """
+    cProfile around single requests, written to a rotating directory
+    Each capture is three files sharing one name: the raw .prof (for
+    snakeviz, pstats, ...), a .txt with the top functions and a .json with
+    the request details. Only the newest `keep` captures are kept.
+    cProfile hooks the thread that enabled it, so captures never overlap:
+    a request that would start a second one runs unprofiled.
+    """
+
+    def __init__(self, directory: str, keep: int = 50, sample_rate: float = 0.0, top: int = 40):
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self.top = top
+        self._busy = threading.Lock()
+        self._rng = random.Random()
+
+    def sampled(self) -> bool:
+        """True for a sample_rate share of calls"""
+        return self.sample_rate > 0 and self._rng.random() < self.sample_rate
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling this thread, or return None if a capture is already running"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler (e.g. a debugger) owns the hook
+            self._busy.release()
+            return None
+        return profile
+
+    def discard(self, profile: cProfile.Profile):
+        profile.disable()
+        self._busy.release()
+
+    def finish(self, profile: cProfile.Profile, info: Dict) -> str:
+        """Stop profile, write its files and return the capture's name"""
+        profile.disable()
+        self._busy.release()
+
+        os.makedirs(self.directory, exist_ok=True)
+        now = datetime.now(timezone.utc)
+        # Millisecond timestamps keep names in capture order for rotation
+        name = (f"{now.strftime('%Y%m%dT%H%M%S')}{now.microsecond // 1000:03d}Z-{_slug(info.get('endpoint', ''))}-"
+                f"{int(info.get('duration_ms', 0))}ms-{uuid.uuid4().hex[:8]}")
+        base = os.path.join(self.directory, name)
+
+        profile.dump_stats(base + '.prof')
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        summary.write(f"{info.get('method')} {info.get('path')} -> {info.get('status')} "
+                      f"in {info.get('duration_ms', 0):.1f} ms\n\n")
+        stats.sort_stats('cumulative').print_stats(self.top)
+        stats.sort_stats('tottime').print_stats(self.top)
+        with open(base + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        with open(base + '.json', 'w') as f:
+            json.dump(dict(info, name=name, created_at=now.strftime('%Y-%m-%dT%H:%M:%SZ')), f)
+
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        captures = self._names()
+        for name in captures[self.keep:]:
+            for kind in KINDS:
+                try:
+                    os.remove(os.path.join(self.directory, f'{name}.{kind}'))
+                except FileNotFoundError:
+                    pass
+
+    def _names(self) -> List[str]:
+        """Capture names, newest first (names start with their UTC timestamp)"""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        names = {f[:-5] for f in files if f.endswith('.json') and _NAME_PATTERN.match(f[:-5])}
+        return sorted(names, reverse=True)
+
+    def captures(self) -> List[Dict]:
+        """Details of every kept capture, newest first"""
+        result = []
+        for name in self._names():
+            try:
+                with open(os.path.join(self.directory, f'{name}.json')) as f:
+                    result.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # rotated away or still being written
+        return result
+
+    def path(self, name: str, kind: str) -> Optional[str]:
+        """File of one capture, or None for unknown names and kinds"""
+        if kind not in KINDS or not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, f'{name}.{kind}')
+        return path if os.path.exists(path) else None
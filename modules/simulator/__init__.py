@@ -0,0 +1,4 @@
+from modules.simulator.engine import SimulationResult, WaveSimulator
+from modules.simulator.data import auto_place_towers, find_map, load_game_data
+
+__all__ = ['SimulationResult', 'WaveSimulator', 'auto_place_towers', 'find_map', 'load_game_data']
@@ -0,0 +1,98 @@
+"""
+Command line entry point for balance runs
+
+    python -m modules.simulator --map 1 --waves 1-20 --runs 200 --auto-towers basic:6
+"""
+import argparse
+import json
+import sys
+import time
+
+from modules.map_store import MapStore
+from modules.simulator.data import auto_place_towers, find_map, load_game_data
+from modules.simulator.engine import MAX_DT, MIN_DT, WaveSimulator, check_dt
+
+
+def parse_waves(spec: str):
+    """Parse '5', '1-20' or '1,3,5' into a list of wave numbers"""
+    waves = []
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = part.split('-', 1)
+            waves.extend(range(int(first), int(last) + 1))
+        else:
+            waves.append(int(part))
+    return waves
+
+
+def parse_tower(spec: str):
+    """Parse 'type:x:y' into a tower placement"""
+    tower_type, x, y = spec.split(':')
+    return {'type': tower_type, 'x': int(x), 'y': int(y)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless tower defense wave simulator')
+    parser.add_argument('--map', default='1', help='map ID or name')
+    parser.add_argument('--maps-db', default='map_data/maps.db')
+    parser.add_argument('--waves', default='1-10', help="e.g. '5', '1-20' or '1,3,5'")
+    parser.add_argument('--runs', type=int, default=100, help='runs per wave')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dt', type=float, default=0.05,
+                        help=f'fixed timestep in seconds ({MIN_DT} to {MAX_DT})')
+    parser.add_argument('--level', type=int, default=None,
+                        help='use the enemy composition of this progression level')
+    parser.add_argument('--tower', action='append', default=[], type=parse_tower,
+                        help="tower placement 'type:x:y' (repeatable)")
+    parser.add_argument('--auto-towers', default=None,
+                        help="place towers next to the path, e.g. 'basic:6'")
+    parser.add_argument('--json', action='store_true', help='print machine-readable output')
+    args = parser.parse_args(argv)
+    try:
+        check_dt(args.dt)
+    except ValueError as e:
+        parser.error(str(e))
+
+    game_data = load_game_data()
+    map_data = find_map(MapStore(args.maps_db).all(), args.map)
+    if map_data is None:
+        parser.error(f'Map not found: {args.map}')
+
+    towers = list(args.tower)
+    if args.auto_towers:
+        tower_type, count = args.auto_towers.split(':')
+        towers.extend(auto_place_towers(map_data, tower_type, int(count)))
+
+    simulator = WaveSimulator(map_data, towers, game_data['towers'], game_data['enemies'],
+                              game_data['progression'], dt=args.dt)
+    waves = parse_waves(args.waves)
+
+    started = time.perf_counter()
+    result = simulator.run(waves, runs=args.runs, seed=args.seed, level=args.level)
+    elapsed = time.perf_counter() - started
+
+    summary = result.summary()
+    simulated = len(waves) * args.runs
+    if args.json:
+        json.dump({
+            'map': map_data.get('name'),
+            'towers': towers,
+            'waves_simulated': simulated,
+            'elapsed': elapsed,
+            'waves_per_second': simulated / elapsed if elapsed else None,
+            'summary': summary
+        }, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"Map: {map_data.get('name')}  towers: {len(towers)}  dt: {args.dt}s")
+    print(f"{'wave':>5} {'enemies':>8} {'lives lost':>11} {'gold':>9} {'kills':>7} {'kill p50':>9}")
+    for row in summary:
+        p50 = f"{row['kill_time_p50']:.1f}s" if row['kill_time_p50'] is not None else '-'
+        print(f"{row['wave']:>5} {row['enemies']:>8} {row['lives_lost']:>11.2f} "
+              f"{row['gold_earned']:>9.1f} {row['kills']:>7.1f} {p50:>9}")
+    print(f"Simulated {simulated} waves in {elapsed:.2f}s ({simulated / elapsed:.0f} waves/s)")
+
+
+if __name__ == '__main__':
+    main()
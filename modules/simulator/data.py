@@ -0,0 +1,64 @@
+import json
+from typing import Dict, List, Optional
+
+
+TOWER_DATA_FILE = 'tower_data/tower_data.json'
+ENEMY_DATA_FILE = 'enemy_data/enemy_data.json'
+PROGRESSION_FILE = 'config/progression.json'
+
+
+def load_json(path: str):
+    """Load a JSON file from disk"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_game_data(tower_path: str = TOWER_DATA_FILE, enemy_path: str = ENEMY_DATA_FILE,
+                   progression_path: str = PROGRESSION_FILE) -> Dict:
+    """Load tower, enemy and progression configuration for a simulation"""
+    return {
+        'towers': load_json(tower_path),
+        'enemies': load_json(enemy_path),
+        'progression': load_json(progression_path)
+    }
+
+
+def find_map(maps: List[Dict], map_ref) -> Optional[Dict]:
+    """Find a map by ID (int or string) or by name"""
+    for map_data in maps:
+        if str(map_data.get('id')) == str(map_ref):
+            return map_data
+    for map_data in maps:
+        if map_data.get('name') == map_ref:
+            return map_data
+    return None
+
+
+def auto_place_towers(map_data: Dict, tower_type: str, count: int) -> List[Dict]:
+    """
+    Place count towers on free cells next to the path, spread evenly along it.
+    Used when a balance run does not specify its own layout.
+    """
+    route = [map_data['start']] + list(map_data['path'])
+    blocked = {(p['x'], p['y']) for p in route}
+    blocked.update((o['x'], o['y']) for o in map_data.get('obstacles', []))
+    dimensions = map_data.get('dimensions', {'width': 32, 'height': 24})
+
+    candidates = []
+    seen = set()
+    for point in route:
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell = (point['x'] + dx, point['y'] + dy)
+                if (cell in blocked or cell in seen or
+                        not 0 <= cell[0] < dimensions['width'] or
+                        not 0 <= cell[1] < dimensions['height']):
+                    continue
+                seen.add(cell)
+                candidates.append(cell)
+
+    if count <= 0 or not candidates:
+        return []
+    step = max(1, len(candidates) // count)
+    chosen = candidates[::step][:count]
+    return [{'x': x, 'y': y, 'type': tower_type} for x, y in chosen]
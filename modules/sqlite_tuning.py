@@ -0,0 +1,105 @@
+import sqlite3
+from typing import Dict
+
+from sqlalchemy import Table
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),      # readers no longer block the writer
+    ('synchronous', 'NORMAL'),    # fsync at checkpoints only; safe with WAL
+    ('busy_timeout', '30000'),    # wait for the write lock instead of failing
+    ('foreign_keys', 'ON'),
+    ('temp_store', 'MEMORY'),
+    ('cache_size', '-16000')      # 16 MB page cache per connection
+)
+
+# First SQLite release with ALTER TABLE ... DROP COLUMN
+DROP_COLUMN_VERSION = (3, 35, 0)
+
+
+def is_sqlite(url) -> bool:
+    """True if the database URL (string or URL) uses the sqlite dialect"""
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    """SQLAlchemy 'connect' event handler setting SQLITE_PRAGMAS"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def engine_options(url, pool_size: int = 10, max_overflow: int = 20) -> Dict:
+    """
+    Engine options for a file-backed SQLite database shared by request threads
+    Connections are pooled (and keep sqlite3's prepared statement cache warm)
+    instead of being reopened per request. Other databases only get the
+    pool sizes; the sqlite3 connect arguments would be rejected there.
+    """
+    options = {'pool_size': pool_size, 'max_overflow': max_overflow}
+    if is_sqlite(url):
+        options['connect_args'] = {
+            'timeout': 30,
+            'check_same_thread': False,
+            'cached_statements': 256
+        }
+    return options
+
+
+def drop_column(engine, table: Table, column: str):
+    """
+    Drop column from the table behind the SQLAlchemy table, which no longer
+    declares it. SQLite before 3.35 has no DROP COLUMN, so there the table
+    is recreated from its model and the rows copied over.
+    """
+    if engine.dialect.name != 'sqlite':
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f'ALTER TABLE "{table.name}" DROP COLUMN "{column}"')
+        return
+    raw = engine.raw_connection()
+    conn = raw.driver_connection
+    isolation_level, conn.isolation_level = conn.isolation_level, None
+    try:
+        if sqlite3.sqlite_version_info >= DROP_COLUMN_VERSION:
+            conn.execute(f'ALTER TABLE "{table.name}" DROP COLUMN "{column}"')
+        else:
+            _rebuild_table(conn, engine.dialect, table)
+    finally:
+        conn.isolation_level = isolation_level
+        raw.close()
+
+
+def _rebuild_table(conn: sqlite3.Connection, dialect, table: Table):
+    """
+    Recreate table with its model's schema and indexes, keeping its rows.
+    Foreign keys are off meanwhile so dropping the old table does not cascade
+    to rows that reference it, and legacy_alter_table keeps those references
+    pointing at the table name instead of following the rename.
+    """
+    old_name = f'{table.name}_old'
+    columns = ', '.join(f'"{column.name}"' for column in table.columns)
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    conn.execute('PRAGMA foreign_keys=OFF')
+    conn.execute('PRAGMA legacy_alter_table=ON')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+            conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+            conn.execute(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+            conn.execute(f'DROP TABLE "{old_name}"')
+            for index in table.indexes:
+                conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+            if conn.execute('PRAGMA foreign_key_check').fetchone():
+                raise sqlite3.IntegrityError(f'Rebuilding {table.name} broke a foreign key')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.execute('PRAGMA legacy_alter_table=OFF')
+        conn.execute(f'PRAGMA foreign_keys={foreign_keys}')
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class UserCache:
+    """
+    Bounded LRU cache with a TTL for per-worker user rows
+    Every key has a generation that invalidate() bumps; a value loaded while
+    its key was invalidated is returned but not stored, so a slow load can
+    never put an outdated row back after a write.
+    invalidate() only reaches this process; pass is_current to get_or_load
+    to catch writes made elsewhere before a cached value is served.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Any, tuple]' = OrderedDict()  # key -> (expires, value)
+        self._generations: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def get_or_load(self, key, loader: Callable[[], Optional[Any]],
+                    is_current: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """
+        Return the cached value for key, calling loader() on a miss.
+        A cached value for which is_current(value) is False is reloaded.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and entry[0] > now
+            if fresh:
+                self._entries.move_to_end(key)
+
+        if fresh and (is_current is None or is_current(entry[1])):
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            if fresh:
+                self.stale += 1
+            # Only drop the entry we looked at, not one stored meanwhile
+            if self._entries.get(key) is entry and entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            generation = self._generations.get(key, 0)
+
+        value = loader()
+        if value is None:
+            return None
+
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        """Drop key; loads that are already running will not be cached"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
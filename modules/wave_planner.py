@@ -0,0 +1,123 @@
+import math
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from modules.content_cache import serialize_json
+from modules.simulator.engine import SPAWN_INTERVAL, apportion, wave_size
+
+
+# Scaling defaults used by the client when an enemy has no scaling entry
+DEFAULT_SCALING = {'hp': 1.2, 'speed': 1.0, 'reward': 1.1}
+# Beyond this the hp exponents of the steepest enemies overflow a float
+MAX_WAVE = 1000
+
+
+def interleave(counts: List[int]) -> List[int]:
+    """
+    Spread the spawns of several groups evenly over a wave.
+    Returns the group index of every spawn; slot k goes to the group that
+    is furthest behind its share of the first k + 1 spawns, ties to the
+    lower index, so the order is deterministic.
+    """
+    total = sum(counts)
+    emitted = [0] * len(counts)
+    order = []
+    for k in range(1, total + 1):
+        group = max(range(len(counts)), key=lambda i: (counts[i] * k / total - emitted[i], -i))
+        emitted[group] += 1
+        order.append(group)
+    return order
+
+
+class WavePlanner:
+    """
+    Spawn schedules per (level, wave) compiled from enemy_data.json and progression.json
+    Every wave has the client's 5 + 2 * wave enemies. A level's enemy counts
+    in progression.json only set the proportions of each type (levels above
+    the last defined one use the last); below the first defined level all
+    types get equal shares. The hp, speed and reward given per level in
+    progression.json are not used: stats come from enemy_data.json and scale
+    with scaling ** (wave - 1), as in the client and the simulator.
+    Waves 1..table_size are serialized up front, later ones on demand.
+    """
+
+    def __init__(self, enemy_types: Dict, progression: Dict, table_size: int = 100,
+                 version: Tuple = ()):
+        self.enemy_types = enemy_types
+        self.version = version  # identifies the source files, e.g. their ETags
+        self.table_size = min(table_size, MAX_WAVE)
+        levels = sorted(progression.get('levels', []), key=lambda x: x['level'])
+        self.level_numbers = [x['level'] for x in levels]
+        self.level_mix = {
+            x['level']: [(name, spec['count']) for name, spec in x.get('enemies', {}).items()
+                         if name in enemy_types and spec.get('count', 0) > 0]
+            for x in levels
+        }
+        self._tables: Dict[Optional[int], List[bytes]] = {
+            level: [serialize_json(self._plan(level, wave)) for wave in range(1, self.table_size + 1)]
+            for level in [None] + self.level_numbers
+        }
+
+    def plan_level(self, level: int) -> Optional[int]:
+        """The progression level whose enemy mix applies at player level, None for the default rule"""
+        pos = bisect_right(self.level_numbers, level)
+        return self.level_numbers[pos - 1] if pos else None
+
+    def _mix(self, plan_level: Optional[int], wave: int) -> List[Tuple[str, int]]:
+        if plan_level is None:
+            weights = [(name, 1) for name in self.enemy_types]
+        else:
+            weights = self.level_mix[plan_level]
+        counts = apportion(wave_size(wave), [weight for _, weight in weights])
+        return [(name, count) for (name, _), count in zip(weights, counts) if count > 0]
+
+    def _plan(self, plan_level: Optional[int], wave: int) -> Dict:
+        exponent = wave - 1
+        groups = []
+        for name, count in self._mix(plan_level, wave):
+            enemy = self.enemy_types[name]
+            scaling = dict(DEFAULT_SCALING, **enemy.get('scaling', {}))
+            groups.append({
+                'type': name,
+                'name': enemy.get('name', name),
+                'count': count,
+                'hp': math.floor(enemy['baseHp'] * scaling['hp'] ** exponent),
+                'speed': round(enemy['baseSpeed'] * scaling['speed'] ** exponent, 6),
+                'reward': math.floor(enemy['baseReward'] * scaling['reward'] ** exponent),
+                'resistance': enemy.get('resistance', 'none'),
+                'attributes': enemy.get('attributes', {})
+            })
+        order = interleave([group['count'] for group in groups])
+        return {
+            'wave': wave,
+            'level': plan_level,
+            'enemy_count': len(order),
+            'spawn_interval': SPAWN_INTERVAL,
+            'duration': round(len(order) * SPAWN_INTERVAL, 6),
+            'total_hp': sum(group['hp'] * group['count'] for group in groups),
+            'total_reward': sum(group['reward'] * group['count'] for group in groups),
+            'groups': groups,
+            # Spawn k is groups[spawns.group[k]] at spawns.time[k] seconds into the wave
+            'spawns': {
+                'group': order,
+                'time': [round((k + 1) * SPAWN_INTERVAL, 6) for k in range(len(order))]
+            }
+        }
+
+    def wave(self, level: int, wave: int) -> bytes:
+        """Serialized plan of one wave for a player level"""
+        if not 1 <= wave <= MAX_WAVE:
+            raise ValueError(f'wave must be between 1 and {MAX_WAVE}')
+        plan_level = self.plan_level(level)
+        if wave <= self.table_size:
+            return self._tables[plan_level][wave - 1]
+        return serialize_json(self._plan(plan_level, wave))
+
+    def waves(self, level: int, first: int, last: int) -> bytes:
+        """Serialized {"level", "first", "last", "waves": [...]} for waves first..last"""
+        if not 1 <= first <= last <= MAX_WAVE:
+            raise ValueError(f'waves must satisfy 1 <= first <= last <= {MAX_WAVE}')
+        bodies = [self.wave(level, wave) for wave in range(first, last + 1)]
+        header = serialize_json({'level': level, 'plan_level': self.plan_level(level),
+                                 'first': first, 'last': last})
+        return b''.join([header[:-1], b',"waves":[', b','.join(bodies), b']}'])
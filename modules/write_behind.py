@@ -0,0 +1,227 @@
+import atexit
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedWrite:
+    """
+    One compare-and-set write queued with WriteBehindBuffer.write_versioned
+    The flush function decides it: accepted is True if base_version was
+    still current, and version is the version after the write (or the
+    current version when it was rejected).
+    """
+
+    __slots__ = ('fields', 'base_version', 'accepted', 'version', 'error', 'done')
+
+    def __init__(self, fields: Dict[str, Any], base_version: int):
+        self.fields = fields
+        self.base_version = base_version
+        self.accepted = False
+        self.version = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces per-user field updates in memory and writes them in batches
+    Updates for the same user are merged (the latest value of each field
+    wins), and batches are written by one flush at a time, so a user's
+    updates always reach the database in the order they were made.
+    A background thread flushes every interval seconds, or as soon as
+    max_pending users are waiting.
+    The queue is per process and updates count as done once queued, so a
+    crash loses whatever has not been flushed yet; use it only for writes
+    that can afford that.
+    Versioned writes (write_versioned) are group committed instead: the
+    caller waits until its write is flushed, and every write queued while
+    a flush runs goes into the next one, so concurrent requests share one
+    transaction. flush_fn(batch, writes) receives the coalesced updates
+    and each key's versioned writes in order, and decides the latter.
+    """
+
+    def __init__(self, flush_fn: Callable[[Dict[Any, Dict[str, Any]], Dict[Any, List[VersionedWrite]]], None],
+                 interval: float = 1.0, max_pending: int = 200):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._inflight: Dict[Any, Dict[str, Any]] = {}
+        self._writes: Dict[Any, List[VersionedWrite]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Bumped (and waiters notified) whenever a flush attempt ends
+        self._flushed = threading.Condition()
+        self._flush_generation = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'flushes': 0,
+            'flushed_users': 0,
+            'failed_flushes': 0,
+            'coalesced_updates': 0,
+            'versioned_writes': 0,
+            'rejected_writes': 0,
+            'max_group_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def update(self, key, fields: Dict[str, Any]):
+        """Queue new values for key's fields"""
+        if not fields:
+            return
+        with self._lock:
+            pending = self._pending.setdefault(key, {})
+            if pending:
+                self._stats['coalesced_updates'] += 1
+            pending.update(fields)
+            full = len(self._pending) >= self.max_pending
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, key) -> Dict[str, Any]:
+        """Values queued (or being written) for key, newest last; versioned writes are not included"""
+        with self._lock:
+            values = dict(self._inflight.get(key, {}))
+            values.update(self._pending.get(key, {}))
+        return values
+
+    def write_versioned(self, key, fields: Dict[str, Any], base_version: int) -> VersionedWrite:
+        """
+        Queue a write of fields for key that only applies while key is still at
+        base_version, and block until a flush has decided it.
+        The caller flushes itself unless a flush is already running, in which
+        case it waits for that one and then for the next, led by one of the
+        waiting callers. Raises the flush's exception if the batch failed.
+        """
+        write = VersionedWrite(fields, base_version)
+        with self._lock:
+            self._writes.setdefault(key, []).append(write)
+            self._stats['versioned_writes'] += 1
+        while not write.done.is_set():
+            with self._flushed:
+                generation = self._flush_generation
+            if self._flush_lock.acquire(blocking=False):
+                try:
+                    self._flush_queued()
+                except Exception:
+                    # Already logged, and set on every write of the batch
+                    pass
+                finally:
+                    self._flush_lock.release()
+                    self._flush_ended()
+            else:
+                with self._flushed:
+                    while self._flush_generation == generation and not write.done.is_set():
+                        self._flushed.wait()
+        if write.error is not None:
+            raise write.error
+        return write
+
+    def flush(self):
+        """Write everything queued so far in one batch (blocks until done)"""
+        try:
+            with self._flush_lock:
+                self._flush_queued()
+        finally:
+            self._flush_ended()
+
+    def _flush_queued(self):
+        """Flush body; the caller holds _flush_lock"""
+        with self._lock:
+            if not self._pending and not self._writes:
+                return
+            batch, self._pending = self._pending, {}
+            writes, self._writes = self._writes, {}
+            self._inflight = batch
+
+        started = time.perf_counter()
+        try:
+            self.flush_fn(batch, writes)
+        except Exception as e:
+            logger.exception('Write-behind flush of %d users failed', len(batch) + len(writes))
+            with self._lock:
+                # Put the batch back underneath anything queued meanwhile
+                for key, fields in batch.items():
+                    newer = self._pending.get(key, {})
+                    self._pending[key] = {**fields, **newer}
+                self._inflight = {}
+                self._stats['failed_flushes'] += 1
+            # Versioned writes are not retried: their callers get the error
+            for key_writes in writes.values():
+                for write in key_writes:
+                    write.error = e
+                    write.done.set()
+            raise
+        elapsed = (time.perf_counter() - started) * 1000
+
+        group_size = 0
+        rejected = 0
+        for key_writes in writes.values():
+            for write in key_writes:
+                group_size += 1
+                rejected += not write.accepted
+                write.done.set()
+        with self._lock:
+            self._inflight = {}
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['flushed_users'] += len(batch.keys() | writes.keys())
+            stats['rejected_writes'] += rejected
+            stats['max_group_size'] = max(stats['max_group_size'], group_size)
+            stats['last_flush_ms'] = elapsed
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], elapsed)
+            stats['total_flush_ms'] += elapsed
+
+    def _flush_ended(self):
+        with self._flushed:
+            self._flush_generation += 1
+            self._flushed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and flush latency counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._pending)
+            stats['queued_fields'] = sum(len(fields) for fields in self._pending.values())
+            stats['queued_versioned_writes'] = sum(len(writes) for writes in self._writes.values())
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        for key in ('last_flush_ms', 'max_flush_ms', 'total_flush_ms', 'avg_flush_ms'):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+    def stop(self):
+        """Stop the background thread and write whatever is still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Already logged; the batch stays queued for the next round
+                pass